@@ -75,6 +75,8 @@ class Index:
     >>> idx.insert('A')
     >>> idx.compare(comparator)
     {('B', 'C'): 0, ('A', 'B'): 0, ('A', 'A'): 1, ('A', 'C'): 0}
+    >>> idx.count()
+    6
     """
 
     def __init__(self, makekey=None, records=None):
@@ -85,7 +87,7 @@ class Index:
         """Compute number of comparisons required."""
         if other is None or other is self:
             nrecs = len(self.records)
-            return nrecs * (nrecs + 1) / 2
+            return nrecs * (nrecs - 1) // 2
         else:
             return len(self.records) * len(other.records)
 
@@ -93,6 +95,31 @@ class Index:
         """Add a record to the index"""
         self.records.append(record)
 
+    def link(self, record, other=None):
+        """Insert a record and return its pairs with the records already in
+        this index, or with all records of `other` if given."""
+        if other is None or other is self:
+            pairs = [(rec, record) if rec <= record else (record, rec)
+                     for rec in self.records]
+        else:
+            pairs = [(record, rec) for rec in other.records]
+        self.insert(record)
+        return pairs
+
+    def pairs(self, other=None):
+        """Generate all pairs of records, in the same order as
+        :func:`within` and :func:`between`."""
+        if other is None or other is self:
+            self.records.sort()
+            records = self.records
+            for i in range(len(records)):
+                for j in range(i):
+                    yield records[j], records[i]
+        else:
+            for rec1 in self.records:
+                for rec2 in other.records:
+                    yield rec1, rec2
+
     def compare(self, simfunc, other=None, comparisons=None):
         """Compute similarity vectors for all pairs of records."""
         if other is None or other is self:
@@ -0,0 +1,201 @@
+"""Band-join index that pairs records with nearby numeric values
+
+Numeric fields such as amounts, years or ages are compared with
+:class:`~sim.Scale` on their difference, but blocking on an ``int()``
+bucket of the value misses neighbours on either side of a bucket edge.
+This index sorts the records on their numeric keys and sweeps a band over
+the sorted list, so that it pairs exactly the records whose values differ
+by at most `tolerance`, and against another index uses a binary search
+for the start of the band.
+"""
+
+from bisect import bisect_left, bisect_right
+import logging
+from operator import itemgetter
+
+LOG = logging.getLogger('dedupe.band')
+
+
+class Index(object):
+    """Sorted list of (value, record) entries, pairing records whose
+    values differ by at most `tolerance`.
+
+    To change the tolerance in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [:class:`float`, ...]
+    :param makekey: Generates the numeric values of the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type tolerance: :class:`float`
+    :param tolerance: Largest difference of values to pair.
+
+    >>> from dedupe import band
+    >>> makekey = lambda r: [r[1]]
+    >>> compare = lambda x, y: abs(x[1] - y[1])
+    >>> records = [('A', 1999), ('B', 2000), ('C', 2002), ('D', 2010)]
+    >>> idx = band.Index(makekey, records, tolerance=2)
+    >>> idx.count()
+    2
+    >>> sorted(idx.compare(compare).items())
+    [((('A', 1999), ('B', 2000)), 1), ((('B', 2000), ('C', 2002)), 2)]
+    >>> other = band.Index(makekey, [('E', 2009), ('F', 1990)], tolerance=2)
+    >>> idx.count(other)
+    1
+    >>> idx.compare(compare, other)
+    {(('D', 2010), ('E', 2009)): 1}
+    """
+
+    def __init__(self, makekey, records=None, tolerance=1.0):
+        if tolerance < 0:
+            raise ValueError("tolerance: {0} is negative".format(tolerance))
+        self.makekey = makekey
+        self.tolerance = tolerance
+        self.entries = []
+        self.sorted = True
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def insert(self, record):
+        """Insert a record into the index.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [:class:`float`, ...]
+        :return: Values under which the record was inserted.
+        """
+        keys = self.makekey(record)
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+            self.entries.append((key, record))
+        self.sorted = False
+        return keys
+
+    def sort(self):
+        """Sort the entries on the value."""
+        if not self.sorted:
+            self.entries.sort(key=itemgetter(0))
+            self.sorted = True
+
+    def values(self):
+        """Sorted list of the values of the entries."""
+        self.sort()
+        return [value for value, _ in self.entries]
+
+    def records_for(self, value):
+        """List of the records having exactly `value`."""
+        values = self.values()
+        return [record for _, record in self.entries[
+            bisect_left(values, value):bisect_right(values, value)]]
+
+    def itergroups(self):
+        """Iterate over (value, records) for each distinct value."""
+        self.sort()
+        entries, start = self.entries, 0
+        for end in xrange(1, len(entries) + 1):
+            if end == len(entries) or entries[end][0] != entries[start][0]:
+                yield entries[start][0], [r for _, r in entries[start:end]]
+                start = end
+
+    def _bands(self, other=None):
+        """Generate (pos, start, end) such that the entry at `pos` is to be
+        paired with the entries from `start` to `end` (exclusive) of the
+        other index, or of this index before `pos`."""
+        self.sort()
+        tolerance = self.tolerance
+        if other is None or other is self:
+            entries, start = self.entries, 0
+            for pos, (value, _) in enumerate(entries):
+                while value - entries[start][0] > tolerance:
+                    start += 1
+                yield pos, start, pos
+        else:
+            values = other.values()
+            start = 0
+            for pos, (value, _) in enumerate(self.entries):
+                # values increase, so the band start only moves forward
+                start = bisect_left(values, value - tolerance, start)
+                yield pos, start, bisect_right(values, value + tolerance,
+                                               start)
+
+    def pairs(self, other=None):
+        """Generate the pairs of records whose values differ by at most
+        `tolerance`. A pair may be generated more than once when the
+        records have several values.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        entries = self.entries
+        if other is None or other is self:
+            for pos, start, end in self._bands():
+                b = entries[pos][1]
+                for i in xrange(start, end):
+                    a = entries[i][1]
+                    if a is not b:
+                        yield (a, b) if a <= b else (b, a)
+        else:
+            for pos, start, end in self._bands(other):
+                a = entries[pos][1]
+                for i in xrange(start, end):
+                    yield a, other.entries[i][1]
+
+    def count(self, other=None):
+        """Return the number of pairs of entries within the tolerance,
+        which is exact unless records have several values.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        return sum(end - start for _, start, end in self._bands(other))
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records with values within the tolerance.
+        By default against itself, and optionally against another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about the sorted values, prefixing with `name`.
+        The widest band is the most entries within one tolerance.
+
+        >>> from dedupe import band
+        >>> idx = band.Index(lambda r: [r[0]], [(1.0,), (1.5,), (5.0,)])
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("BandIdx")
+        name=IdxSize idx=BandIdx entries=3 values=3 tolerance=1.0 widest=2
+        """
+        if self.entries:
+            widest = max(end - start + 1 for _, start, end in self._bands())
+            LOG.info("name=IdxSize idx=%s entries=%s values=%s tolerance=%s "
+                     "widest=%s", name, len(self.entries),
+                     sum(1 for _ in self.itergroups()), self.tolerance,
+                     widest)
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
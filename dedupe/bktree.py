@@ -0,0 +1,366 @@
+"""BK-tree index that pairs records whose keys are within a distance
+
+Short code fields such as postcodes or product codes have no reliable
+blocking key, as any character may be mistyped, so they were compared with
+:class:`~allpairs.Index`.  When the distance between keys is a metric, as
+are :func:`~levenshtein.distance` and :func:`~geo.distance`, a BK-tree
+(Burkhard and Keller, 1973) finds the keys within a radius of a probe key
+using the triangle inequality: below a node at distance `d` from the probe,
+only the subtrees of children at distance `d - radius` to `d + radius` from
+the node can hold keys within the radius.
+
+The children of a node are keyed by their distance from it, so the tree
+assumes an integer-valued metric such as an edit distance, having few
+distinct distances.  With a continuous metric almost every key would be a
+new child of the root and the search would scan them all, so give the
+index a `resolution` that buckets the distances, searching every bucket
+that may hold a distance in the range.
+
+:func:`~dale.distance` counts transpositions as in the optimal string
+alignment distance, which does not satisfy the triangle inequality, so
+with it the tree can miss a few keys that a scan would find.
+"""
+
+from __future__ import division
+import logging
+import math
+
+from dedupe.compat import OrderedDict as _OrderedDict
+from dedupe.levenshtein import distance as levenshtein
+from dedupe.sim import rank
+
+LOG = logging.getLogger('dedupe.bktree')
+
+
+class Index(dict):
+    """Mapping from index key to records, with a BK-tree over the keys for
+    pairing the records whose keys are within `radius` of each other.
+
+    To change the metric or radius in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [`K`, ...]
+    :param makekey: Generates the index keys for the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type metric: function(`K`, `K`) :class:`float`
+    :param metric: Distance between keys, satisfying the triangle inequality.
+    :type radius: :class:`float`
+    :param radius: Largest distance between keys of records to pair.
+    :type resolution: :class:`float` or :keyword:`None`
+    :param resolution: Width of the buckets of distance under which to\
+    file the children of a node, required for a continuous `metric`.
+
+    >>> from dedupe import bktree
+    >>> makekey = lambda r: [r[1]]
+    >>> compare = lambda x, y: x[1] == y[1]
+    >>> records = [('A', 'NW1 5LR'), ('B', 'NW1 5RL'), ('C', 'NW1 6LR'),
+    ...            ('D', 'SE3 7QT')]
+    >>> idx = bktree.Index(makekey, records, radius=1)
+    >>> idx.count()
+    1
+    >>> idx.compare(compare)
+    {(('A', 'NW1 5LR'), ('C', 'NW1 6LR')): False}
+    >>> other = bktree.Index(makekey, [('E', 'SE3 7QJ')], radius=1)
+    >>> idx.compare(compare, other)
+    {(('D', 'SE3 7QT'), ('E', 'SE3 7QJ')): False}
+    >>> idx.lookup([('F', 'NW1 5LQ')])
+    [[('A', 'NW1 5LR')]]
+
+    Coordinates with :func:`~geo.distance` in kilometres:
+
+    >>> from dedupe import geo
+    >>> makekey = lambda r: [r[1:]]
+    >>> places = [('A', 51.50, -0.12), ('B', 51.52, -0.10), ('C', 52.2, 0.1)]
+    >>> idx = bktree.Index(makekey, places, metric=geo.distance, radius=5,
+    ...                    resolution=10)
+    >>> list(idx.pairs())
+    [(('A', 51.5, -0.12), ('B', 51.52, -0.1))]
+    """
+
+    def __init__(self, makekey, records=None, metric=levenshtein, radius=1,
+                 resolution=None):
+        super(Index, self).__init__()
+        if radius < 0:
+            raise ValueError("radius: {0} is negative".format(radius))
+        if resolution is not None and resolution <= 0:
+            raise ValueError(
+                "resolution: {0} is not positive".format(resolution))
+        self.makekey = makekey
+        self.metric = metric
+        self.radius = radius
+        self.resolution = resolution
+        # each node of the tree is (key, {distance bucket: child node})
+        self.root = None
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def insert(self, record):
+        """Insert a record into the index.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [`K`, ...]
+        :return: Keys under which the record was inserted.
+        """
+        keys = self.makekey(record)
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+            if key not in self:
+                self[key] = []
+                self._insert_key(key)
+            self[key].append(record)
+        return keys
+
+    def _insert_key(self, key):
+        """Add a new key to the tree."""
+        if self.root is None:
+            self.root = (key, {})
+            return
+        node = self.root
+        while True:
+            dist = self._bucket(self.metric(key, node[0]))
+            child = node[1].get(dist)
+            if child is None:
+                node[1][dist] = (key, {})
+                return
+            node = child
+
+    def _bucket(self, dist):
+        """Bucket of the children of a node at distance `dist` from it."""
+        if self.resolution is None:
+            return dist
+        return int(math.floor(dist / self.resolution))
+
+    def near(self, key, radius=None):
+        """Find the keys of the index within `radius` of `key`.
+
+        :type key: `K`
+        :param key: Probe key, which need not be in the index.
+        :type radius: :class:`float` or :keyword:`None`
+        :param radius: Largest distance, by default that of the index.
+        :rtype: [(`K`, :class:`float`), ...]
+        :return: Keys of the index and their distance from `key`.
+
+        >>> from dedupe import bktree
+        >>> idx = bktree.Index(lambda r: [r], ['SMITH', 'SMYTH', 'SMITHE'])
+        >>> sorted(idx.near('SMIT'))
+        [('SMITH', 1)]
+        >>> sorted(idx.near('SMIT', 2))
+        [('SMITH', 1), ('SMITHE', 2), ('SMYTH', 2)]
+        """
+        if radius is None:
+            radius = self.radius
+        result = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, children = stack.pop()
+            dist = self.metric(key, node_key)
+            if dist <= radius:
+                result.append((node_key, dist))
+            low = self._bucket(dist - radius)
+            high = self._bucket(dist + radius)
+            for childdist, child in children.iteritems():
+                if low <= childdist <= high:
+                    stack.append(child)
+        return result
+
+    def records_for(self, key):
+        """Return the list of records having exactly `key`."""
+        return self.get(key, [])
+
+    def itergroups(self):
+        """Iterate over (key, records) for each distinct key."""
+        return self.iteritems()
+
+    def _keypairs(self, other=None):
+        """Generate (key, records, other records) for each key and each key
+        within the radius, in the other index or for a single index the
+        greater keys, without the pairs within the same key."""
+        if other is None or other is self:
+            for key, records in self.iteritems():
+                for near, _ in self.near(key):
+                    if key < near:
+                        yield key, records, self[near]
+        else:
+            if other.radius != self.radius:
+                raise ValueError("radius: {0} != {1}".format(
+                    self.radius, other.radius))
+            for key, records in self.iteritems():
+                for near, _ in other.near(key, self.radius):
+                    yield key, records, other[near]
+
+    def pairs(self, other=None):
+        """Generate the pairs of records whose keys are within the radius.
+        A pair may be generated more than once when the records have
+        several keys.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        if other is None or other is self:
+            for records in self.itervalues():
+                for j in xrange(1, len(records)):
+                    b = records[j]
+                    for i in xrange(j):
+                        a = records[i]
+                        if a is not b:
+                            yield (a, b) if a <= b else (b, a)
+            for _, records1, records2 in self._keypairs():
+                for a in records1:
+                    for b in records2:
+                        if a is not b:
+                            yield (a, b) if a <= b else (b, a)
+        else:
+            for _, records1, records2 in self._keypairs(other):
+                for a in records1:
+                    for b in records2:
+                        yield a, b
+
+    def count(self, other=None):
+        """Return the number of pairs of records within the radius, which
+        is exact unless records have several keys.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        total = sum(len(r1) * len(r2) for _, r1, r2 in self._keypairs(other))
+        if other is None or other is self:
+            total += sum(len(r) * (len(r) - 1) // 2 for r in self.itervalues())
+        return total
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records with keys within the radius.
+        By default against itself, and optionally against another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def lookup(self, probes, compare=None, k=None, score=None):
+        """Find the indexed records with a key within the radius of a key of
+        each of several probe records.  Probes sharing a key search the tree
+        once for that key.
+
+        :type probes: [`R1`, ...]
+        :param probes: Records to look up.
+        :type compare: function(`R1`, `R2`) [`float`, ...] or :keyword:`None`
+        :param compare: Optional function (such as :class:`~sim.Record`)\
+        for comparing each probe with its candidates.
+        :type k: :class:`int` or :keyword:`None`
+        :param k: With `compare`, keep only the `k` best candidates.
+        :type score: function([`float`, ...]) `float`
+        :param score: Ranks the similarity vectors, by default\
+        :func:`~sim.total`.
+        :rtype: [[`R2`, ...], ...] or [[(`R2`, [`float`, ...]), ...], ...]
+        :return: For each probe, the distinct candidate records, or with\
+        `compare` the (candidate, similarity) pairs from best to worst.
+
+        >>> from functools import partial
+        >>> from dedupe import bktree, sim
+        >>> strategy = [("Code", partial(bktree.Index, radius=2),
+        ...              lambda r: [r[1]])]
+        >>> master = sim.Indices(strategy, [('A', 'X123'), ('B', 'X456')])
+        >>> master.lookup([('C', 'X132'), ('D', 'Y999')])
+        [[('A', 'X123')], []]
+        """
+        bykey = _OrderedDict()
+        for pos, probe in enumerate(probes):
+            for key in self.makekey(probe):
+                bykey.setdefault(key, []).append(pos)
+        found = [[] for _ in probes]
+        seen = [set() for _ in probes]
+        for key, positions in bykey.iteritems():
+            for near, _ in sorted(self.near(key), key=lambda e: e[1]):
+                for pos in positions:
+                    for record in self[near]:
+                        if record not in seen[pos]:
+                            seen[pos].add(record)
+                            found[pos].append(record)
+        if compare is None:
+            return found
+        return [rank([(record, compare(probe, record)) for record in records],
+                     k, score) for probe, records in zip(probes, found)]
+
+    def link(self, record, other=None):
+        """Insert a record and return the pairs it forms with the records
+        already indexed under keys within the radius.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair the record with records of this index instead.
+        :rtype: [(`R1`, `R2`), ...]
+        :return: Distinct pairs, ordered as by :meth:`pairs`.
+
+        >>> from dedupe import bktree
+        >>> idx = bktree.Index(lambda r: [r[1]], [('A', 'AB1')])
+        >>> idx.link(('B', 'AB2'))
+        [(('A', 'AB1'), ('B', 'AB2'))]
+        """
+        selflink = other is None or other is self
+        index = self if selflink else other
+        result, seen = [], set()
+        for key in self.makekey(record):
+            for near, _ in index.near(key, self.radius):
+                for rec in index[near]:
+                    if id(rec) not in seen:
+                        seen.add(id(rec))
+                        if not selflink:
+                            result.append((record, rec))
+                        else:
+                            result.append(
+                                (rec, record) if rec <= record
+                                else (record, rec))
+        self.insert(record)
+        return result
+
+    def depth(self):
+        """Number of levels of the tree."""
+        levels = 0
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            levels += 1
+            nodes = [child for _, children in nodes
+                     for child in children.itervalues()]
+        return levels
+
+    def log_size(self, name):
+        """Log statistics about the keys and the tree, prefixing with `name`.
+
+        >>> from dedupe import bktree
+        >>> idx = bktree.Index(lambda r: [r], ['AB1', 'AB2', 'XY9'])
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("TreeIdx")
+        name=IdxSize idx=TreeIdx keys=3 recs=3 radius=1 depth=2
+        """
+        if self:
+            LOG.info("name=IdxSize idx=%s keys=%s recs=%s radius=%s depth=%s",
+                     name, len(self), sum(len(r) for r in self.itervalues()),
+                     self.radius, self.depth())
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
@@ -7,13 +7,57 @@ have same index key, which saves a lot of comparisons.
 For example, indexing on the double-metaphone of a field will mean only
 computing similarity vectors for pairs records that have the same
 douple-metaphone.
+
+Long keys, such as a double-metaphone joined with a postcode, can be
+stored as 64-bit hashes with the `hashkeys` parameter of :class:`Index`,
+which shrinks the index and speeds up looking up keys.
+
+The :class:`CompactIndex` variant stores integer record IDs in arrays
+rather than lists of records, for indexing large numbers of records.
+An index saved with :meth:`Index.save` is re-opened as a read-only
+:class:`MappedIndex`, which memory-maps the file instead of loading it.
 """
 
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+import hashlib
 import logging
+import marshal
+import mmap
+from operator import itemgetter
+import struct
+import sys
+
+from dedupe.compat import OrderedDict as _OrderedDict
+from dedupe.sim import rank
 
 LOG = logging.getLogger('dedupe.block')
 
 
+def hashkey(key):
+    """Hash a key to a 64-bit integer, which is the same in every process
+    and on every platform, for storing keys compactly.
+
+    :type key: :mod:`marshal`-able value such as a string, number or tuple
+    :param key: The key to hash. A :class:`str` and the equal\
+    :class:`unicode` string hash differently.
+    :rtype: :class:`int`
+    :return: Signed 64-bit integer.
+
+    >>> from dedupe import block
+    >>> block.hashkey(('TM', 'NW1')) == block.hashkey(('TM', 'NW1'))
+    True
+    >>> block.hashkey('SMITH'[:2]) == block.hashkey('SM')
+    True
+    >>> block.hashkey('SMITH') != block.hashkey('SMYTH')
+    True
+    """
+    # version 0 of marshal does not mark interned strings differently
+    return struct.unpack(
+        '<q', hashlib.md5(marshal.dumps(key, 0)).digest()[:8])[0]
+
+
 class Index(dict):
     """Mapping from index key to records.
 
@@ -23,6 +67,47 @@ class Index(dict):
     :type records: [`R`, ...]
     :param records: Initial records to load into the index.
 
+    :type maxblock: :class:`int` or :keyword:`None`
+    :param maxblock: Blocks with more records than this are split into\
+    sub-blocks on the `subkey` before comparing.
+
+    :type subkey: function(`R`) [`K`, ...] or [function(`R`) [`K`, ...], ...]
+    :param subkey: Generates sub-keys for splitting oversized blocks. A list\
+    of functions splits sub-blocks that are still too large on the next\
+    function. Sub-blocks left too large after the last function are\
+    compared in full.
+
+    :type maxfreq: :class:`int` or :class:`float` or :keyword:`None`
+    :param maxfreq: Purge keys found in more records than this, such as\
+    a common surname or a default phone number. Values below 1.0 are a\
+    fraction of the number of records, checked before comparing, while\
+    other values are checked as the records are inserted, so that a\
+    purged block never holds more than `maxfreq` records.
+
+    :type stoplist: [`K`, ...]
+    :param stoplist: Keys never to index.
+
+    :type hashkeys: :class:`bool`
+    :param hashkeys: Store each key as its :func:`hashkey` instead of the\
+    key itself. Colliding keys merge their blocks, which only adds\
+    candidate pairs. Indices to be compared must all hash their keys or\
+    none of them.
+
+    :type keytable: :class:`bool`
+    :param keytable: With `hashkeys`, keep a table of the original key of\
+    each hash, for reporting the keys (see :meth:`original`) and counting\
+    the hash collisions.  The table only holds the first key of each hash,\
+    so it counts the collisions but does not keep the records of colliding\
+    keys apart: their candidate pairs are not checked against the table.
+
+    :type purged: {`K`: :class:`int`}
+    :ivar purged: Number of records having each purged or stoplisted key,\
+    see :meth:`purge_report`.
+
+    :type collisions: :class:`int`
+    :ivar collisions: With `keytable`, the number of keys whose hash was\
+    already that of another key, whose block they share.
+
     >>> makekey = lambda r: [int(r[1])]
     >>> makekey(('A', 3.5))
     [3]
@@ -43,9 +128,24 @@ class Index(dict):
     (('A', 5.5), ('D', 5.5)): 1.0, (('B', 4.5), ('E', 4.5)): 1.0}
     """
 
-    def __init__(self, makekey, records=None):
+    def __init__(self, makekey, records=None, maxblock=None, subkey=None,
+                 maxfreq=None, stoplist=None, hashkeys=False, keytable=False):
         super(Index, self).__init__()
         self.makekey = makekey
+        self.maxblock = maxblock
+        self.maxfreq = maxfreq
+        self.hashkeys = hashkeys
+        self.keytable = {} if hashkeys and keytable else None
+        self.collisions = 0
+        self.purged = dict((self._stored(key), 0) for key in stoplist or ())
+        self.nrecs = 0
+        if subkey is None:
+            self.subkeys = ()
+        elif callable(subkey):
+            self.subkeys = (subkey,)
+        else:
+            self.subkeys = tuple(subkey)
+        self.joinstats = None
         if records:
             for record in records:
                 self.insert(record)
@@ -63,10 +163,348 @@ class Index(dict):
             if key is None or key == "":
                 raise ValueError("Empty index key in %s for record %s" % (
                     repr(keys), repr(record)))
+        for key in self._blockkeys(keys):
+            key = self._stored(key)
+            if key in self.purged:
+                self.purged[key] += 1
+                continue
             recordsforkey = self.setdefault(key, list())
             recordsforkey.append(record)
+            if self._toobig(recordsforkey):
+                self.purged[key] = len(self.pop(key))
+        self.nrecs += 1
+        return keys
+
+    def _blockkeys(self, keys):
+        """Keys of the blocks holding a record with index keys `keys`,
+        which are the keys themselves."""
         return keys
 
+    def _stored(self, key):
+        """The form in which `key` is stored, which is its hash with
+        `hashkeys`, adding the key to the key table if there is one."""
+        if not self.hashkeys:
+            return key
+        hashed = hashkey(key)
+        if self.keytable is not None:
+            known = self.keytable.setdefault(hashed, key)
+            if known != key:
+                self.collisions += 1
+        return hashed
+
+    def _probed(self, key):
+        """The stored form of a key being looked up, without adding the key
+        to the key table."""
+        return hashkey(key) if self.hashkeys else key
+
+    def storedkeys(self, record):
+        """Set of the keys of `record`, in the form stored in the index,
+        for deciding which index and key own a pair of records (see\
+        :meth:`~sim.Indices.owned_pairs`).
+
+        >>> from dedupe import block
+        >>> idx = block.Index(lambda r: [r[0], r[1]], hashkeys=True)
+        >>> idx.storedkeys(('A', 'A')) == set([block.hashkey('A')])
+        True
+        """
+        return set(self._probed(key)
+                   for key in self._blockkeys(self.makekey(record)))
+
+    def original(self, key):
+        """The original key of a stored key, which is the key itself
+        unless it is a hash and the index has a key table, where it is the
+        first key stored under the hash.
+
+        >>> from dedupe import block
+        >>> makekey = lambda r: [r[0]]
+        >>> idx = block.Index(makekey, [('SMITH', 1), ('SMITH', 2)],
+        ...                   hashkeys=True, keytable=True)
+        >>> [(idx.original(key), len(recs)) for key, recs in idx.iteritems()]
+        [('SMITH', 2)]
+        >>> idx.lookup([('SMITH', 3)])
+        [[('SMITH', 1), ('SMITH', 2)]]
+        """
+        if self.keytable is None:
+            return key
+        return self.keytable.get(key, key)
+
+    def _purges(self, key):
+        """Whether the block of `key` is purged, or is over a fractional
+        `maxfreq` so that :meth:`purge` would purge it."""
+        if key in self.purged:
+            return True
+        return (self.maxfreq is not None and self.maxfreq < 1.0 and
+                len(self.get(key, ())) > self.maxfreq * self.nrecs)
+
+    def _toobig(self, records):
+        """Whether a block being built is over an absolute `maxfreq`."""
+        return (self.maxfreq is not None and self.maxfreq >= 1.0 and
+                len(records) > self.maxfreq)
+
+    def purge(self):
+        """Purge the keys found in more than a fraction `maxfreq` of the
+        records, which is called before comparing. Keys over an absolute
+        `maxfreq` are purged when inserting records."""
+        if self.maxfreq is not None and self.maxfreq < 1.0:
+            cutoff = self.maxfreq * self.nrecs
+            for key in [key for key, records in self.iteritems()
+                        if len(records) > cutoff]:
+                self.purged[key] = len(self.pop(key))
+
+    def purge_report(self, limit=None):
+        """List the purged keys, with the most frequent first.
+
+        :type limit: :class:`int` or :keyword:`None`
+        :param limit: Report at most this many keys.
+        :rtype: [(`K`, :class:`int`, :class:`int`), ...]
+        :return: Purged keys with their number of records and the number\
+        of comparisons within the block saved by purging it.
+
+        >>> from dedupe import block
+        >>> makekey = lambda r: [r[0], r[1]]
+        >>> records = [('SMITH', '555'), ('SMITH', '123'), ('SMITH', '555'),
+        ...            ('JONES', '555'), ('BLOGGS', '000')]
+        >>> idx = block.Index(makekey, records, maxfreq=2, stoplist=['000'])
+        >>> sorted(idx.keys())
+        ['123', 'BLOGGS', 'JONES']
+        >>> idx.purge_report()
+        [('555', 3, 3), ('SMITH', 3, 3), ('000', 1, 0)]
+        >>> frac = block.Index(makekey, records, maxfreq=0.5)
+        >>> frac.count()
+        0
+        >>> frac.purge_report(1)
+        [('555', 3, 3)]
+        """
+        self.purge()
+        report = sorted(((self.original(key), nrecs, nrecs * (nrecs - 1) // 2)
+                         for key, nrecs in self.purged.iteritems()),
+                        key=lambda item: (-item[1], item[0]))
+        return report[:limit] if limit is not None else report
+
+    def records_for(self, key):
+        """List of the records indexed under `key`."""
+        return self[key]
+
+    def itergroups(self):
+        """Iterate over (key, records) for each key in the index."""
+        return self.iteritems()
+
+    def _ordered(self, records):
+        """Order the records of a block so that pairs are generated as
+        (a, b) with a <= b."""
+        records.sort()
+        return records
+
+    def _pair(self, old, new):
+        """Pair a previously indexed record with a newly inserted one,
+        in the same order as :meth:`pairs` would."""
+        return (old, new) if old <= new else (new, old)
+
+    def _oversize(self, *blocks):
+        """Whether any of the blocks is larger than :attr:`maxblock`."""
+        return (self.maxblock is not None and
+                any(len(block) > self.maxblock for block in blocks))
+
+    def _group(self, records, depth):
+        """Group records on the sub-key function at `depth`, returning the
+        groups and the records having no sub-key, which stay paired with
+        all records of the block."""
+        groups, unkeyed = {}, []
+        for record in records:
+            keys = [key for key in self.subkeys[depth](record)
+                    if key is not None and key != ""]
+            if not keys:
+                unkeyed.append(record)
+            for key in keys:
+                groups.setdefault(key, []).append(record)
+        return groups, unkeyed
+
+    def _split(self, records, depth=0):
+        """Recursively split `records` on the sub-keys until each block has
+        at most :attr:`maxblock` records or the sub-keys run out. Records
+        without a sub-key are put in every sub-block.
+
+        >>> from dedupe import block
+        >>> idx = block.Index(lambda r: [r[0]], maxblock=2,
+        ...                   subkey=lambda r: [r[1]])
+        >>> sorted(idx._split([('A', 'x'), ('B', 'x'), ('C', 'y'),
+        ...                    ('D', '')]))
+        [[('A', 'x'), ('B', 'x'), ('D', '')], [('C', 'y'), ('D', '')]]
+        """
+        if depth >= len(self.subkeys) or not self._oversize(records):
+            yield records
+        else:
+            groups, unkeyed = self._group(records, depth)
+            if not groups:
+                groups = {None: []}
+            for group in groups.itervalues():
+                for block in self._split(group + unkeyed, depth + 1):
+                    yield block
+
+    def _split_other(self, records1, records2, depth=0):
+        """Recursively split a pair of blocks from two indices on the
+        sub-keys, yielding pairs of sub-blocks having the same sub-key.
+        Records without a sub-key are put in every sub-block."""
+        if depth >= len(self.subkeys) or not self._oversize(
+            records1, records2):
+            yield records1, records2
+            return
+        groups1, unkeyed1 = self._group(records1, depth)
+        groups2, unkeyed2 = self._group(records2, depth)
+        if not groups1 or not groups2:
+            # one side has no sub-keys, so splitting pairs nothing apart
+            for blocks in self._split_other(records1, records2, depth + 1):
+                yield blocks
+            return
+        for key in set(groups1).union(groups2):
+            group1 = groups1.get(key, []) + unkeyed1
+            group2 = groups2.get(key, []) + unkeyed2
+            if group1 and group2:
+                for blocks in self._split_other(group1, group2, depth + 1):
+                    yield blocks
+
+    def _narrow(self, probes, records, depth=0):
+        """Generate (position, sub-block) for each sub-block of `records`
+        that each (position, record) of `probes` falls into when splitting
+        on the sub-keys, grouping the records only once for all probes.
+        A probe without a sub-key falls into the whole block."""
+        if depth >= len(self.subkeys) or not self._oversize(records):
+            for pos, _ in probes:
+                yield pos, records
+            return
+        groups, unkeyed = self._group(records, depth)
+        subprobes, residual = {}, []
+        for pos, probe in probes:
+            keys = set(key for key in self.subkeys[depth](probe)
+                       if key is not None and key != "")
+            if not keys:
+                yield pos, records
+            elif not keys.intersection(groups):
+                residual.append((pos, probe))
+            for key in keys.intersection(groups):
+                subprobes.setdefault(key, []).append((pos, probe))
+        for key, keyprobes in subprobes.iteritems():
+            for result in self._narrow(
+                keyprobes, groups[key] + unkeyed, depth + 1):
+                yield result
+        if residual and unkeyed:
+            for result in self._narrow(residual, unkeyed, depth + 1):
+                yield result
+
+    def blocks(self, other=None):
+        """Generate the blocks of records to compare, after splitting blocks
+        larger than :attr:`maxblock` on the sub-keys.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Pair up blocks with blocks of this index.
+        :rtype: iter [[`R`, ...], ...] or iter [([`R1`, ...], [`R2`, ...])]
+        :return: Lists of records, or pairs of lists of records having the\
+        same key when `other` is given.
+
+        >>> from dedupe import block
+        >>> makekey = lambda r: [r[0]]
+        >>> subkey = lambda r: [r[1][0]]
+        >>> idx = block.Index(makekey, [('A', 'x1'), ('A', 'x2'), ('A', 'y')],
+        ...                   maxblock=2, subkey=subkey)
+        >>> sorted(idx.blocks())
+        [[('A', 'x1'), ('A', 'x2')], [('A', 'y')]]
+        >>> idx.count()
+        1
+        """
+        self.purge()
+        if other is None or other is self:
+            for _, records in self.itergroups():
+                for block in self._split(records):
+                    yield block
+        else:
+            for _, records1, records2 in self.join(other):
+                for blocks in self._split_other(records1, records2):
+                    yield blocks
+
+    def _sortedkeys(self):
+        """Iterate over (marshalled key, handle) in order of marshalled key,
+        where :meth:`_handle_records` gets the records of a handle."""
+        return iter(sorted(
+            (marshal.dumps(key, 0), key) for key in self.iterkeys()))
+
+    def _handle_records(self, handle):
+        """Records for a handle from :meth:`_sortedkeys`."""
+        return self.records_for(handle)
+
+    def join(self, other, method=None):
+        """Generate the keys found in both this and the other index, with
+        the records of each index for that key. Afterwards the join
+        statistics are kept in :attr:`joinstats`, which
+        :meth:`~sim.Indices.log_comparisons` logs.
+
+        The "hash" join iterates over the keys of the index with fewer keys
+        and looks each key up in the larger index. The "merge" join steps
+        through the keys of both indices in sorted order, which reads the
+        keys of a :class:`MappedIndex` sequentially from the file instead of
+        making one binary search per key, and is the default if either
+        index is a :class:`MappedIndex`.
+
+        :type other: :class:`Index`
+        :param other: Join with this index.
+        :type method: "hash", "merge" or :keyword:`None`
+        :param method: The join method, by default chosen as above.
+        :rtype: iter [(`K`, [`R1`, ...], [`R2`, ...]), ...]
+        :return: Key, records of `self` and records of `other`.
+
+        >>> from dedupe import block
+        >>> makekey = lambda r: [int(r[1])]
+        >>> a = block.Index(makekey, [('A', 5.5), ('B', 4.5), ('C', 3.0)])
+        >>> b = block.Index(makekey, [('D', 5.5), ('E', 4.5)])
+        >>> sorted(a.join(b, "merge")) == sorted(a.join(b, "hash"))
+        True
+        >>> sorted(a.join(b))
+        [(4, [('B', 4.5)], [('E', 4.5)]), (5, [('A', 5.5)], [('D', 5.5)])]
+        >>> sorted(a.joinstats.items())
+        [('common', 2), ('keys1', 3), ('keys2', 2), ('method', 'hash'),\
+ ('probes', 2)]
+        >>> list(a.join(block.Index(makekey, [('F', 5.0)], hashkeys=True)))
+        Traceback (most recent call last):
+            ...
+        ValueError: hashkeys: False != True
+        """
+        if self.hashkeys != other.hashkeys:
+            raise ValueError("hashkeys: {0} != {1}".format(
+                self.hashkeys, other.hashkeys))
+        self.purge()
+        other.purge()
+        if method is None:
+            method = "merge" if isinstance(self, MappedIndex) or \
+                     isinstance(other, MappedIndex) else "hash"
+        stats = dict(method=method, keys1=len(self), keys2=len(other),
+                     common=0, probes=0)
+        if method == "hash":
+            small, large = (self, other) if len(self) <= len(other) \
+                           else (other, self)
+            for key in small.iterkeys():
+                stats["probes"] += 1
+                if key in large:
+                    stats["common"] += 1
+                    yield key, self.records_for(key), other.records_for(key)
+        elif method == "merge":
+            keys1, keys2 = self._sortedkeys(), other._sortedkeys()
+            raw1, handle1 = next(keys1, (None, None))
+            raw2, handle2 = next(keys2, (None, None))
+            while raw1 is not None and raw2 is not None:
+                stats["probes"] += 1
+                if raw1 < raw2:
+                    raw1, handle1 = next(keys1, (None, None))
+                elif raw1 > raw2:
+                    raw2, handle2 = next(keys2, (None, None))
+                else:
+                    stats["common"] += 1
+                    yield (marshal.loads(raw1), self._handle_records(handle1),
+                           other._handle_records(handle2))
+                    raw1, handle1 = next(keys1, (None, None))
+                    raw2, handle2 = next(keys2, (None, None))
+        else:
+            raise ValueError("join method: {0!r}".format(method))
+        self.joinstats = stats
+
     def count(self, other=None):
         """Return upper bound on the number of comparisons required by this
         index. The actual number of comparison function calls will be lower
@@ -78,24 +516,146 @@ class Index(dict):
         comparisons = 0
         if not other or (other is self):
             # Count up comparisons to be made within this set of records.
-            for recs in self.itervalues():
+            for recs in self.blocks():
                 if len(recs) > 1:
                     comparisons += len(recs) * (len(recs) - 1) // 2
         else:
             # Count up comparisons to be made to another set of records.
-            for key in self:
-                if key in other:
-                    comparisons += len(self[key]) * len(other[key])
+            for recs1, recs2 in self.blocks(other):
+                comparisons += len(recs1) * len(recs2)
         return comparisons
 
     def search(self, record):
         """Returns a list of records that are indexed under the same keys as
-        the provided record."""
-        result = []
-        for key in self.makekey(record):
-            result.extend(self.get(key), [])
+        the provided record, each listed once."""
+        return self.lookup([record])[0]
+
+    def lookup(self, probes, compare=None, k=None, score=None):
+        """Find the indexed records sharing a key with each of several probe
+        records, such as looking up records in a master index. The keys
+        of the probes are computed once, and the records under each key are
+        fetched once for all probes having that key.
+
+        :type probes: [`R1`, ...]
+        :param probes: Records to look up.
+        :type compare: function(`R1`, `R2`) [`float`, ...] or :keyword:`None`
+        :param compare: Optional function (such as :class:`~sim.Record`)\
+        for comparing each probe with its candidates.
+        :type k: :class:`int` or :keyword:`None`
+        :param k: With `compare`, keep only the `k` best candidates.
+        :type score: function([`float`, ...]) `float`
+        :param score: Ranks the similarity vectors, by default\
+        :func:`~sim.total`.
+        :rtype: [[`R2`, ...], ...] or [[(`R2`, [`float`, ...]), ...], ...]
+        :return: For each probe, the distinct candidate records, or with\
+        `compare` the (candidate, similarity) pairs from best to worst.
+
+        >>> from dedupe import block
+        >>> makekey = lambda r: [int(r[1])]
+        >>> idx = block.Index(makekey, [('A', 5.5), ('B', 4.5), ('C', 5.0)])
+        >>> idx.lookup([('D', 5.25), ('E', 7.0)])
+        [[('A', 5.5), ('C', 5.0)], []]
+        >>> compare = lambda x, y: 2**-abs(float(x[1])-float(y[1]))
+        >>> idx.lookup([('D', 5.0)], compare, k=1)
+        [[(('C', 5.0), 1.0)]]
+        """
+        self.purge()
+        bykey = _OrderedDict()
+        for pos, probe in enumerate(probes):
+            for key in self._blockkeys(self.makekey(probe)):
+                bykey.setdefault(self._probed(key), []).append((pos, probe))
+        found = [[] for _ in probes]
+        seen = [set() for _ in probes]
+        for key, keyprobes in bykey.iteritems():
+            if key not in self:
+                continue
+            for pos, block in self._narrow(keyprobes, self.records_for(key)):
+                for record in block:
+                    if record not in seen[pos]:
+                        seen[pos].add(record)
+                        found[pos].append(record)
+        if compare is None:
+            return found
+        return [rank([(record, compare(probe, record)) for record in records],
+                     k, score) for probe, records in zip(probes, found)]
+
+    def link(self, record, other=None):
+        """Insert a record and return the pairs it forms with the records
+        already in the same blocks, for linking records as they arrive.
+        Purged blocks are skipped, including those over a fractional
+        `maxfreq` of the records indexed so far, which :meth:`purge` would
+        purge before comparing.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair the record with records of this index instead.
+        :rtype: [(`R1`, `R2`), ...]
+        :return: Distinct pairs, ordered as by :meth:`pairs`.
+
+        >>> from dedupe import block
+        >>> makekey = lambda r: [int(r[1])]
+        >>> idx = block.Index(makekey, [('B', 5.5), ('C', 4.5)])
+        >>> idx.link(('A', 5.25))
+        [(('A', 5.25), ('B', 5.5))]
+        >>> idx.link(('D', 5.0))
+        [(('B', 5.5), ('D', 5.0)), (('A', 5.25), ('D', 5.0))]
+        >>> other = block.Index(makekey, [('E', 4.0)])
+        >>> idx.link(('F', 4.75), other)
+        [(('F', 4.75), ('E', 4.0))]
+        >>> frac = block.Index(lambda r: [r[0]],
+        ...                    [('a', 1), ('a', 2), ('b', 3)], maxfreq=0.5)
+        >>> frac.link(('a', 4))
+        []
+        >>> frac.link(('b', 5))
+        [(('b', 3), ('b', 5))]
+        """
+        keys = self.insert(record)
+        selflink = other is None or other is self
+        index = self if selflink else other
+        result, seen = [], set([id(record)])
+        for blockkey in self._blockkeys(keys):
+            key = index._probed(blockkey)
+            if key not in index or index._purges(key):
+                continue
+            if not selflink and self._purges(self._probed(blockkey)):
+                continue
+            for _, block in index._narrow(
+                [(0, record)], index.records_for(key)):
+                for rec in block:
+                    if id(rec) not in seen:
+                        seen.add(id(rec))
+                        result.append(self._pair(rec, record) if selflink
+                                      else (record, rec))
         return result
 
+    def pairs(self, other=None):
+        """Generate the pairs of records that share a block. A pair may be
+        generated more than once when the records share several keys.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        if other is None or other is self:
+            for records in self.blocks():
+                records = self._ordered(records)  # ensure a < b
+                for j in range(len(records)):
+                    for i in range(j):
+                        # i < j, and sorting means record[i] <= record[j]
+                        a, b = records[i], records[j]
+                        # same record indexed under multiple keys!
+                        if a is b:
+                            continue
+                        yield a, b
+        else:
+            for records1, records2 in self.blocks(other):
+                for rec1 in records1:
+                    for rec2 in records2:
+                        yield rec1, rec2
+
     def compare(self, compare, other=None, comparisons=None):
         """Perform comparisons based on the index groups.  By default
         against itself, and optionally against another index.
@@ -113,41 +673,54 @@ class Index(dict):
 
         :return: Updated comparisons dict.
         """
-        if other is None or other is self:
-            return self._compare_self(compare, comparisons)
-        else:
-            return self._compare_other(compare, other, comparisons)
-
-    def _compare_self(self, compare, comparisons=None):
-        """Perform within-index comparisons."""
         if comparisons is None:
             comparisons = {}
-        for records in self.itervalues():
-            records.sort()  # sort the group to ensure a < b
-            for j in range(len(records)):
-                for i in range(j):
-                    # i < j, and sorting means record[i] <= record[j]
-                    a, b = records[i], records[j]
-                    # same record indexed under multiple keys!
-                    if a is b:
-                        continue
-                    # now compare a and b, keeping a <= b
-                    if (a, b) not in comparisons:
-                        comparisons[(a, b)] = compare(a, b)
+        for pair in self.pairs(other):
+            # now compare a and b, keeping a <= b
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
         return comparisons
 
-    def _compare_other(self, compare, other, comparisons=None):
-        """Perform comparisons against another index."""
-        if comparisons is None:
-            comparisons = {}
-        for indexkey in self.iterkeys():
-            if indexkey in other.iterkeys():
-                for rec1 in self[indexkey]:
-                    for rec2 in other[indexkey]:
-                        pair = (rec1, rec2)
-                        if pair not in comparisons:
-                            comparisons[pair] = compare(pair[0], pair[1])
-        return comparisons
+    def _table(self):
+        """Record table and mapping from key to array of record IDs."""
+        table, ids, postings = [], {}, {}
+        for key, records in self.itergroups():
+            recids = postings[key] = array('i')
+            for record in records:
+                recid = ids.get(id(record))
+                if recid is None:
+                    recid = ids[id(record)] = len(table)
+                    table.append(record)
+                recids.append(recid)
+        return table, postings
+
+    def save(self, path):
+        """Save the index to a binary file at `path`, which is opened
+        with :class:`MappedIndex`. The keys and record fields must be
+        :mod:`marshal`-able values such as strings and numbers.
+
+        >>> import os, tempfile
+        >>> from dedupe import block
+        >>> makekey = lambda r: [int(r[1])]
+        >>> idx = block.Index(makekey, [('A', 5.5), ('B', 4.5), ('C', 5.0)])
+        >>> path = os.path.join(tempfile.mkdtemp(), 'idx.bin')
+        >>> idx.save(path)
+        >>> mapped = block.MappedIndex(makekey, path)
+        >>> mapped
+        MappedIndex({4: [('B', 4.5)], 5: [('A', 5.5), ('C', 5.0)]})
+        >>> mapped.compare(lambda a, b: 1.0, idx)[(('B', 4.5), ('B', 4.5))]
+        1.0
+        >>> mapped.close()
+        """
+        self.purge()
+        table, postings = self._table()
+        _write_mapped(path, table, postings, self.maxblock, self.hashkeys)
+
+    @classmethod
+    def load(cls, makekey, path, **options):
+        """Open an index of this type saved with :meth:`save` as a
+        read-only :class:`MappedIndex`, passing on the `options`."""
+        return MappedIndex(makekey, path, **options)
 
     def log_size(self, name):
         """Log statistics about block sizes for `index`, prefixing with `name`.
@@ -160,12 +733,473 @@ class Index(dict):
         >>> LOG.info = log
         >>> idx.log_size("NumIdx")
         name=IdxSize idx=NumIdx recs=3 blocks=2 max=2 avg=1.50
+        >>> idx = block.Index(makekey, [('A', 5.5), ('B', 5.5), ('C', 5.25)],
+        ...                   maxblock=2, subkey=lambda r: [r[1]])
+        >>> idx.log_size("SplitIdx")
+        name=IdxSize idx=SplitIdx recs=3 blocks=1 max=3 avg=3.00
+        name=IdxSplit idx=SplitIdx split=1 subblocks=2 max=2
+        >>> idx = block.Index(makekey, [('A', 5.5), ('B', 5.5), ('C', 5.5),
+        ...                             ('D', 4.5)], maxfreq=2)
+        >>> idx.log_size("PurgeIdx")
+        name=IdxSize idx=PurgeIdx recs=1 blocks=1 max=1 avg=1.00
+        name=IdxPurge idx=PurgeIdx keys=1 recs=3 saved=3 top=5:3
+        >>> idx = block.Index(makekey, [('A', 5.5), ('B', 4.5)],
+        ...                   hashkeys=True, keytable=True)
+        >>> idx.log_size("HashIdx")
+        name=IdxSize idx=HashIdx recs=2 blocks=2 max=1 avg=1.00
+        name=IdxHash idx=HashIdx keys=2 collisions=0
         """
+        self.purge()
         if self:
             records = sum(len(recs) for recs in self.itervalues())
             largest = max(len(recs) for recs in self.itervalues())
             blocks = len(self)
             LOG.info("name=IdxSize idx=%s recs=%s blocks=%s max=%s avg=%.2f",
                      name, records, blocks, largest, float(records) / blocks)
+            if self.subkeys and self._oversize(
+                max(self.itervalues(), key=len)):
+                split, subblocks, sublargest = 0, 0, 0
+                for _, recs in self.itergroups():
+                    if self._oversize(recs):
+                        split += 1
+                        for block in self._split(recs):
+                            subblocks += 1
+                            sublargest = max(sublargest, len(block))
+                LOG.info("name=IdxSplit idx=%s split=%s subblocks=%s max=%s",
+                         name, split, subblocks, sublargest)
         else:
             LOG.info("name=EmptyIndex idx=%s",  name)
+        if self.keytable is not None:
+            LOG.info("name=IdxHash idx=%s keys=%s collisions=%s",
+                     name, len(self.keytable), self.collisions)
+        if self.purged:
+            report = self.purge_report()
+            LOG.info("name=IdxPurge idx=%s keys=%s recs=%s saved=%s top=%s",
+                     name, len(report), sum(n for _, n, _ in report),
+                     sum(saved for _, _, saved in report),
+                     ",".join("%s:%s" % (key, n) for key, n, _ in report[:5]))
+
+
+class RecordTable(list):
+    """Table of records indexed by record ID, in which equal records share
+    one ID, for one or more :class:`CompactIndex` indices.
+
+    >>> from dedupe import block
+    >>> table = block.RecordTable()
+    >>> table.add(('A', 1)), table.add(('B', 2)), table.add(('A', 1))
+    (0, 1, 0)
+    >>> table
+    [('A', 1), ('B', 2)]
+    """
+
+    def __init__(self):
+        super(RecordTable, self).__init__()
+        self.ids = {}
+
+    def add(self, record):
+        """Return the ID of the record, adding it to the table unless an
+        equal record is already there."""
+        recid = self.ids.get(record)
+        if recid is None:
+            recid = self.ids[record] = len(self)
+            self.append(record)
+        return recid
+
+
+class CompactIndex(Index):
+    """Block index that stores integer record IDs instead of records.
+
+    Each record is stored once in the :attr:`records` table, and the
+    index maps each key to an :class:`array.array` of IDs of the records
+    having that key, which takes much less memory than lists of records.
+    Equal records share one ID, so a record repeated in the input is
+    indexed once and not paired with its copy, and the IDs of each block
+    are kept in increasing order.
+
+    With its own table, the index generates pairs as :class:`Index` does,
+    with the lesser record first, so that the cross-index caching of
+    :class:`~sim.Indices` finds the same pair in each index.  Indices sharing
+    one `table` instead put the record with the lesser ID first, which
+    needs no sorting of the records of each block: :class:`~sim.Indices`
+    shares a table when all its indices are :class:`CompactIndex` types.
+
+    The other parameters are the same as for :class:`Index`.
+
+    :type table: :class:`RecordTable` or :keyword:`None`
+    :param table: Record table shared with other indices.
+
+    :type records: :class:`RecordTable`
+    :ivar records: Table of records, indexed by record ID.
+    :type idorder: :class:`bool`
+    :ivar idorder: Whether pairs are ordered by record ID, with a `table`.
+
+    >>> from dedupe import block
+    >>> makekey = lambda r: [int(r[1])]
+    >>> compare = lambda x, y: 2**-abs(float(x[1])-float(y[1]))
+    >>> a = block.CompactIndex(makekey, [('C', 5.0), ('B', 4.5), ('A', 5.5)])
+    >>> a
+    {4: array('i', [1]), 5: array('i', [0, 2])}
+    >>> a.records_for(5)
+    [('C', 5.0), ('A', 5.5)]
+    >>> a.count()
+    1
+    >>> a.compare(compare)
+    {(('A', 5.5), ('C', 5.0)): 0.7071067811865476}
+    >>> rows = [('A', '1'), ('B', '1'), ('A', '1')]
+    >>> list(block.CompactIndex(lambda r: [r[1], r[1]], rows).pairs())
+    [(('A', '1'), ('B', '1'))]
+    >>> c = block.CompactIndex(makekey, [('B', 5.5)])
+    >>> c.link(('A', 5.25))
+    [(('A', 5.25), ('B', 5.5))]
+    >>> b = block.CompactIndex(makekey, [('D', 5.5), ('E', 4.5)])
+    >>> a.count(b)
+    3
+    >>> sorted(a.compare(compare, b).items())  #doctest: +NORMALIZE_WHITESPACE
+    [((('A', 5.5), ('D', 5.5)), 1.0), ((('B', 4.5), ('E', 4.5)), 1.0),\
+    ((('C', 5.0), ('D', 5.5)), 0.7071067811865476)]
+
+    With a shared table, the pairs are in ID order:
+
+    >>> table = block.RecordTable()
+    >>> a = block.CompactIndex(makekey, [('C', 5.0), ('A', 5.5)], table=table)
+    >>> n = block.CompactIndex(lambda r: [r[0]], [('C', 5.0), ('A', 5.5)],
+    ...                        table=table)
+    >>> list(a.pairs()), n.records is a.records
+    ([(('C', 5.0), ('A', 5.5))], True)
+    """
+
+    idorder = False
+
+    def __init__(self, makekey, records=None, maxblock=None, subkey=None,
+                 maxfreq=None, stoplist=None, hashkeys=False, keytable=False,
+                 table=None):
+        self.records = table if table is not None else RecordTable()
+        self.idorder = table is not None
+        super(CompactIndex, self).__init__(
+            makekey, records, maxblock, subkey, maxfreq, stoplist, hashkeys,
+            keytable)
+
+    def insert(self, record):
+        """Insert a record into the record table and its ID into the index.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [`K`, ...]
+        :return: Keys under which the record was inserted.
+        """
+        keys = self.makekey(record)
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+        recid = self.records.add(record)
+        for key in self._blockkeys(keys):
+            key = self._stored(key)
+            if key in self.purged:
+                self.purged[key] += 1
+                continue
+            idsforkey = self.get(key)
+            if idsforkey is None:
+                idsforkey = self[key] = array('i')
+            pos = bisect_left(idsforkey, recid)
+            if pos < len(idsforkey) and idsforkey[pos] == recid:
+                continue  # the record (or an equal one) has this key
+            idsforkey.insert(pos, recid)
+            if self._toobig(idsforkey):
+                self.purged[key] = len(self.pop(key))
+        self.nrecs += 1
+        return keys
+
+    def _ordered(self, records):
+        """Order the records of a block by ID with a shared table, which
+        only needs sorting if the block was split on sub-keys."""
+        if not self.idorder:
+            return super(CompactIndex, self)._ordered(records)
+        if self.subkeys and self.maxblock is not None:
+            records.sort(key=self.records.ids.__getitem__)
+        return records
+
+    def _pair(self, old, new):
+        """Pair a previously indexed record with a newly inserted one,
+        in the same order as :meth:`pairs` would."""
+        if not self.idorder:
+            return super(CompactIndex, self)._pair(old, new)
+        ids = self.records.ids
+        return (old, new) if ids[old] <= ids[new] else (new, old)
+
+    def link(self, record, other=None):
+        """Insert a record and return the pairs it forms with the records
+        already in the same blocks, see :meth:`Index.link`.  The record is
+        not paired with an equal record, which has the same ID."""
+        pairs = super(CompactIndex, self).link(record, other)
+        if other is None or other is self:
+            pairs = [(a, b) for a, b in pairs if a != b]
+        return pairs
+
+    def records_for(self, key):
+        """List of the records indexed under `key`, in ID order."""
+        records = self.records
+        return [records[recid] for recid in self[key]]
+
+    def itergroups(self):
+        """Iterate over (key, records) for each key in the index."""
+        records = self.records
+        for key, ids in self.iteritems():
+            yield key, [records[recid] for recid in ids]
+
+    def _table(self):
+        """Record table and mapping from key to array of record IDs."""
+        return self.records, self
+
+
+_MAGIC = 'DDIDX002'
+_OFFSET = struct.Struct('<q')
+
+
+def _write_mapped(path, table, postings, maxblock=None, hashkeys=False):
+    """Write a record table and key postings in the :class:`MappedIndex`
+    file format: magic, header length, marshalled header, then sections
+    of little-endian offsets, sorted marshalled keys, int32 record IDs
+    and marshalled records."""
+    # version 0 of marshal does not mark interned strings differently
+    entries = sorted(((marshal.dumps(key, 0), recids)
+                      for key, recids in postings.iteritems()),
+                     key=itemgetter(0))
+    records = [marshal.dumps(tuple(record), 2) for record in table]
+    sections = []
+
+    def offsets(items):
+        """Packed cumulative offsets of the items."""
+        total, result = 0, [_OFFSET.pack(0)]
+        for item in items:
+            total += len(item)
+            result.append(_OFFSET.pack(total))
+        return ''.join(result)
+    ids = array('i')
+    for _, recids in entries:
+        ids.extend(recids)
+    if sys.byteorder != 'little':
+        ids.byteswap()
+    sections.append(offsets(k for k, _ in entries))
+    sections.append(''.join(k for k, _ in entries))
+    sections.append(offsets(r for _, r in entries))
+    sections.append(ids.tostring())
+    sections.append(offsets(records))
+    sections.append(''.join(records))
+    fields = getattr(table[0], '_fields', None) if table else None
+    header = {'fields': fields and tuple(fields), 'maxblock': maxblock,
+              'hashkeys': hashkeys, 'nkeys': len(entries),
+              'nrecs': len(records),
+              'sections': tuple(len(section) for section in sections)}
+    header = marshal.dumps(header, 2)
+    with open(path, 'wb') as stream:
+        stream.write(_MAGIC)
+        stream.write(_OFFSET.pack(len(header)))
+        stream.write(header)
+        for section in sections:
+            stream.write(section)
+
+
+class _MappedRecords(object):
+    """Read-only sequence of records decoded from a memory-mapped file."""
+
+    def __init__(self, mapped, offsets, data, nrecs, fields):
+        self.mapped = mapped
+        self.offsets = offsets
+        self.data = data
+        self.nrecs = nrecs
+        self.Row = namedtuple('Row', fields)._make if fields else tuple
+
+    def __len__(self):
+        return self.nrecs
+
+    def __getitem__(self, recid):
+        if recid < 0:
+            recid += self.nrecs
+        if not 0 <= recid < self.nrecs:
+            raise IndexError(recid)
+        pos = self.offsets + _OFFSET.size * recid
+        start, end = struct.unpack_from('<qq', self.mapped, pos)
+        return self.Row(marshal.loads(
+            self.mapped[self.data + start:self.data + end]))
+
+    def __iter__(self):
+        for recid in xrange(self.nrecs):
+            yield self[recid]
+
+
+class MappedIndex(CompactIndex):
+    """Read-only :class:`CompactIndex` on a memory-mapped file written by
+    :meth:`Index.save`.
+
+    Opening the index only reads the header. Keys are found by binary
+    search over the sorted keys in the file, and records are decoded from
+    their offsets when needed, so several processes opening the same file
+    share one copy of it in the page cache.  Keys are matched on their
+    marshalled form, so a key must have the same type as when it was saved
+    (for example :class:`unicode` rather than :class:`str`).
+
+    :type makekey: function(`R`) [`K`, ...]
+    :param makekey: Generates the index keys for a record, which must be\
+    the same as when the index was saved.
+    :type path: :class:`str`
+    :param path: File written by :meth:`Index.save`.
+    :type maxblock, subkey: see :class:`Index`
+    :param maxblock, subkey: Splitting of oversized blocks (by default\
+    `maxblock` is the saved value).
+    :param maxfreq, stoplist: Accepted for the same strategy as the saved\
+    index, which was purged before saving.
+    :param hashkeys, keytable: Accepted for the same strategy as the saved\
+    index, whose keys are hashed if they were when saving, and which has\
+    no key table.
+
+    :type records: [`R`, ...]
+    :ivar records: Read-only table of records, indexed by record ID.
+    """
+
+    def __init__(self, makekey, path, maxblock=None, subkey=None,
+                 maxfreq=None, stoplist=None, hashkeys=False, keytable=False):
+        self.path = path
+        self.stream = open(path, 'rb')
+        self.mapped = mmap.mmap(
+            self.stream.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapped[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("{0}: not a saved index".format(path))
+        pos = len(_MAGIC) + _OFFSET.size
+        length, = _OFFSET.unpack_from(self.mapped, len(_MAGIC))
+        header = marshal.loads(self.mapped[pos:pos + length])
+        pos += length
+        starts = []
+        for size in header['sections']:
+            starts.append(pos)
+            pos += size
+        (self._keyoffsets, self._keydata, self._postoffsets,
+         self._postings, recoffsets, recdata) = starts
+        self._nkeys = header['nkeys']
+        super(CompactIndex, self).__init__(
+            makekey, None, maxblock if maxblock is not None
+            else header['maxblock'], subkey,
+            hashkeys=header.get('hashkeys', False))
+        self.records = _MappedRecords(self.mapped, recoffsets, recdata,
+                                      header['nrecs'], header['fields'])
+        self.nrecs = header['nrecs']
+
+    def close(self):
+        """Close the memory map and the file."""
+        self.mapped.close()
+        self.stream.close()
+
+    def insert(self, record):
+        """The saved index cannot be modified."""
+        raise TypeError("{0}: index is read-only".format(self.path))
+
+    def _range(self, offsets, pos):
+        """Start and end offsets of item `pos` in an offsets section."""
+        return struct.unpack_from(
+            '<qq', self.mapped, offsets + _OFFSET.size * pos)
+
+    def _rawkey(self, pos):
+        """Marshalled bytes of the key at position `pos`."""
+        start, end = self._range(self._keyoffsets, pos)
+        return self.mapped[self._keydata + start:self._keydata + end]
+
+    def _ids(self, pos):
+        """Array of record IDs for the key at position `pos`."""
+        start, end = self._range(self._postoffsets, pos)
+        size = array('i').itemsize
+        ids = array('i', self.mapped[self._postings + start * size:
+                                     self._postings + end * size])
+        if sys.byteorder != 'little':
+            ids.byteswap()
+        return ids
+
+    def _find(self, key):
+        """Position of `key` in the sorted keys, or -1 if absent."""
+        try:
+            target = marshal.dumps(key, 0)
+        except ValueError:
+            return -1
+        low, high = 0, self._nkeys
+        while low < high:
+            mid = (low + high) // 2
+            if self._rawkey(mid) < target:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._nkeys and self._rawkey(low) == target:
+            return low
+        return -1
+
+    def __len__(self):
+        return self._nkeys
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __getitem__(self, key):
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self._ids(pos)
+
+    def get(self, key, default=None):
+        pos = self._find(key)
+        return self._ids(pos) if pos >= 0 else default
+
+    def iterkeys(self):
+        for pos in xrange(self._nkeys):
+            yield marshal.loads(self._rawkey(pos))
+    __iter__ = iterkeys
+
+    def itervalues(self):
+        for pos in xrange(self._nkeys):
+            yield self._ids(pos)
+
+    def iteritems(self):
+        for pos in xrange(self._nkeys):
+            yield marshal.loads(self._rawkey(pos)), self._ids(pos)
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def _records_at(self, pos):
+        """List of the records for the key at position `pos`, in ID order.
+        Records appearing more than once are decoded once."""
+        records, decoded = self.records, {}
+        result = []
+        for recid in self._ids(pos):
+            if recid not in decoded:
+                decoded[recid] = records[recid]
+            result.append(decoded[recid])
+        return result
+
+    def records_for(self, key):
+        """List of the records indexed under `key`, in ID order."""
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self._records_at(pos)
+
+    def _sortedkeys(self):
+        """Iterate over (marshalled key, position) in key order."""
+        for pos in xrange(self._nkeys):
+            yield self._rawkey(pos), pos
+
+    def _handle_records(self, pos):
+        """Records for a key position from :meth:`_sortedkeys`."""
+        return self._records_at(pos)
+
+    def itergroups(self):
+        """Iterate over (key, records) for each key in the index."""
+        for key in self.iterkeys():
+            yield key, self.records_for(key)
+
+    def __repr__(self):
+        return "MappedIndex({{{0}}})".format(", ".join(
+            "{0!r}: {1!r}".format(k, v) for k, v in self.itergroups()))
@@ -0,0 +1,282 @@
+"""Canopy index that pairs records having a high cheap similarity
+
+Canopy clustering (McCallum, Nigam and Ungar, 2000) uses a cheap similarity
+to divide the records into overlapping canopies, so that the expensive
+record comparison only runs on pairs of records sharing a canopy.  Here
+the cheap similarity is the cosine between the token sets of two records,
+such as their words or q-grams, with each token optionally weighted by its
+inverse document frequency.  An inverted index from token to records finds
+the records similar to each canopy centre without scanning all records.
+
+Each record not yet removed in turn becomes the centre of a canopy.  The
+canopy holds the records whose similarity to the centre is at least
+`loose`, and the records at least `tight` similar to the centre are
+removed from the pool of centres, so that near duplicates do not each
+produce another copy of the same canopy.
+"""
+
+from array import array
+import logging
+import math
+
+LOG = logging.getLogger('dedupe.canopy')
+
+
+class Index(object):
+    """Overlapping canopies of records, built from a cheap cosine similarity
+    of the record tokens, pairing records that share a canopy.
+
+    The canopies are built on first use after the records are loaded, and
+    rebuilt if further records are inserted.
+
+    To change the thresholds in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [`K`, ...]
+    :param makekey: Generates the tokens for the record, such as\
+    :func:`~qgram.getter` or :func:`~get.multivalue`.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type loose: :class:`float`
+    :param loose: Records at least this similar to a centre join its canopy.
+    :type tight: :class:`float`
+    :param tight: Records at least this similar to a centre do not become\
+    centres themselves.
+    :type idf: :class:`bool`
+    :param idf: Weight each token by its inverse document frequency,\
+    log(N/df), for TF-IDF cosine similarity instead of plain token overlap.
+
+    :type records: [`R`, ...]
+    :ivar records: Table of records, indexed by record ID.
+
+    >>> from dedupe import canopy, get
+    >>> makekey = get.multivalue(' ', 1)
+    >>> compare = lambda x, y: float(x[1] == y[1])
+    >>> records = [('A', 'acme widget co'), ('B', 'acme widget company'),
+    ...            ('C', 'zebra stripes inc'), ('D', 'acme stripes inc')]
+    >>> idx = canopy.Index(makekey, records, loose=0.5, tight=0.6, idf=False)
+    >>> sorted(idx.itergroups())
+    [(0, [('A', 'acme widget co'), ('B', 'acme widget company')]),\
+ (2, [('C', 'zebra stripes inc'), ('D', 'acme stripes inc')])]
+    >>> idx.count()
+    2
+    >>> sorted(idx.compare(compare))
+    [(('A', 'acme widget co'), ('B', 'acme widget company')),\
+ (('C', 'zebra stripes inc'), ('D', 'acme stripes inc'))]
+    >>> other = canopy.Index(makekey, [('E', 'zebra stripes')], loose=0.5)
+    >>> idx.compare(compare, other)
+    {(('C', 'zebra stripes inc'), ('E', 'zebra stripes')): 0.0}
+    """
+
+    def __init__(self, makekey, records=None, loose=0.3, tight=0.6,
+                 idf=True):
+        if not 0.0 < loose <= tight <= 1.0:
+            raise ValueError("loose: {0}, tight: {1}".format(loose, tight))
+        self.makekey = makekey
+        self.loose = loose
+        self.tight = tight
+        self.idf = idf
+        self.records = []
+        self.tokens = []
+        self.postings = {}
+        self.canopies = None
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def insert(self, record):
+        """Insert a record into the record table and its ID into the
+        postings of each of its tokens.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [`K`, ...]
+        :return: Tokens of the record.
+        """
+        keys = self.makekey(record)
+        recid = len(self.records)
+        tokens = []
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+            ids = self.postings.get(key)
+            if ids is None:
+                ids = self.postings[key] = array('i')
+            if not ids or ids[-1] != recid:
+                ids.append(recid)
+                tokens.append(key)
+        self.records.append(record)
+        self.tokens.append(tuple(tokens))
+        self.canopies = None
+        return keys
+
+    def _weigher(self, other=None):
+        """Token weight function, with document frequencies over the
+        records of this index and of `other`."""
+        indices = [self] if other is None or other is self else [self, other]
+        nrecs = float(sum(len(index.records) for index in indices))
+        weights = {}
+
+        def weight(token):
+            """Weight of a token, 1.0 unless using IDF."""
+            if not self.idf:
+                return 1.0
+            if token not in weights:
+                freq = sum(len(index.postings.get(token, ()))
+                           for index in indices)
+                weights[token] = math.log(nrecs / freq)
+            return weights[token]
+        return weight
+
+    def _norms(self, weight):
+        """Vector length of the weighted tokens of each record."""
+        return [math.sqrt(sum(weight(token) ** 2 for token in tokens))
+                for tokens in self.tokens]
+
+    def _similar(self, tokens, norm, weight, norms):
+        """Map IDs of records in this index to their cosine similarity
+        with `tokens` of length `norm`, if at least `loose`."""
+        dots = {}
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids:
+                square = weight(token) ** 2
+                for recid in ids:
+                    dots[recid] = dots.get(recid, 0.0) + square
+        loose = self.loose
+        return dict((recid, dot / (norm * norms[recid]))
+                    for recid, dot in dots.iteritems()
+                    if dot and dot / (norm * norms[recid]) >= loose)
+
+    def build(self):
+        """Build the canopies, mapping the ID of each centre to the array
+        of the IDs in its canopy, if not already built."""
+        if self.canopies is not None:
+            return
+        weight = self._weigher()
+        norms = self._norms(weight)
+        removed = [False] * len(self.records)
+        self.canopies = {}
+        for center, tokens in enumerate(self.tokens):
+            if removed[center] or not norms[center]:
+                continue
+            removed[center] = True
+            similar = self._similar(tokens, norms[center], weight, norms)
+            for recid, similarity in similar.iteritems():
+                if similarity >= self.tight:
+                    removed[recid] = True
+            if len(similar) > 1:
+                members = sorted(similar)
+                members.remove(center)
+                self.canopies[center] = array('i', [center] + members)
+
+    def records_for(self, center):
+        """List of the records in the canopy of record ID `center`."""
+        self.build()
+        records = self.records
+        return [records[recid] for recid in self.canopies[center]]
+
+    def itergroups(self):
+        """Iterate over (centre ID, records) for each canopy."""
+        self.build()
+        for center in self.canopies:
+            yield center, self.records_for(center)
+
+    def pairs(self, other=None):
+        """Generate the pairs of records sharing a canopy. A pair may be
+        generated once for each canopy that it shares.
+
+        Against another index, no canopies are built: a record of this
+        index is paired with each record of `other` that would join a
+        canopy centred on it, with IDF over the records of both indices.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        if other is None or other is self:
+            self.build()
+            records = self.records
+            for center in sorted(self.canopies):
+                members = self.canopies[center]
+                for j in xrange(1, len(members)):
+                    b = records[members[j]]
+                    for i in xrange(j):
+                        a = records[members[i]]
+                        yield (a, b) if a <= b else (b, a)
+        else:
+            weight = self._weigher(other)
+            norms = self._norms(weight)
+            other_norms = other._norms(weight)
+            for a, tokens, norm in zip(self.records, self.tokens, norms):
+                if norm:
+                    similar = other._similar(tokens, norm, weight,
+                                             other_norms)
+                    for recid in sorted(similar):
+                        yield a, other.records[recid]
+
+    def count(self, other=None):
+        """Return upper bound on the number of comparisons required by this
+        index. The actual number of comparison function calls will be lower
+        due to pairs sharing more than one canopy.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        if other is None or other is self:
+            self.build()
+            return sum(len(ids) * (len(ids) - 1) // 2
+                       for ids in self.canopies.itervalues())
+        return sum(1 for _ in self.pairs(other))
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records sharing a canopy. By default
+        against itself, and optionally against another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about canopy sizes, prefixing with `name`.
+
+        >>> from dedupe import canopy
+        >>> makekey = lambda r: r[0].split()
+        >>> idx = canopy.Index(makekey, [('a b',), ('a b',), ('c',)])
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("CanopyIdx")
+        name=IdxSize idx=CanopyIdx recs=3 canopies=1 max=2 avg=2.00 alone=1
+        """
+        self.build()
+        if self.canopies:
+            sizes = [len(ids) for ids in self.canopies.itervalues()]
+            covered = set()
+            for ids in self.canopies.itervalues():
+                covered.update(ids)
+            LOG.info("name=IdxSize idx=%s recs=%s canopies=%s max=%s "
+                     "avg=%.2f alone=%s", name, len(self.records),
+                     len(sizes), max(sizes), float(sum(sizes)) / len(sizes),
+                     len(self.records) - len(covered))
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
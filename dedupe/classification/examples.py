@@ -7,6 +7,38 @@ import dedupe.sim as sim
 from dedupe.linkcsv import write_comparisons
 
 
+def _split(records):
+    """Split example records into the match and the non-match rows."""
+    t_rows = [r for r in records if r[0] in
+              ['TRUE', 'T', 'YES', 'Y', '1', 1, True]]
+    f_rows = [r for r in records if r[0] in
+              ['FALSE', 'F', 'NO', 'N', '0', 0, False]]
+    return t_rows, f_rows
+
+
+def pairs(records):
+    """Pairs of example records without comparing them, such as for
+    evaluating index keys (see :mod:`dedupe.learnblock`).
+
+    :type records: [('TRUE'|'FALSE', `key`, `value`, ...), ...]
+    :param records: training records with match & key in first two fields,\
+       as for :func:`load`.
+    :rtype: [(`R`, `R`), ...], [(`R`, `R`), ...]
+    :return: pairs of matching records and pairs of non-matching records.
+
+    >>> from dedupe.classification import examples
+    >>> records = [('TRUE', '1', 'Joe'), ('TRUE', '1', 'Jo'),
+    ...            ('FALSE', '2', 'Abe'), ('FALSE', '2', 'Bob'), ('', '', '')]
+    >>> examples.pairs(records)
+    ([(('TRUE', '1', 'Jo'), ('TRUE', '1', 'Joe'))],\
+ [(('FALSE', '2', 'Abe'), ('FALSE', '2', 'Bob'))])
+    """
+    t_rows, f_rows = _split(records)
+    makekey = lambda r: [r[1]]
+    return (list(block.Index(makekey, t_rows).pairs()),
+            list(block.Index(makekey, f_rows).pairs()))
+
+
 def load(comparator, records, outdir=None):
     """Use example records to create match and non-match similarity vectors
     for training a classifier.
@@ -59,10 +91,7 @@ def load(comparator, records, outdir=None):
  ',1,8', ',1,7', '1.0,True,0.5',\
  ',2,3', ',2,5', '1.0,True,0.25']
     """
-    t_rows = [r for r in records if r[0] in
-              ['TRUE', 'T', 'YES', 'Y', '1', 1, True]]
-    f_rows = [r for r in records if r[0] in
-              ['FALSE', 'F', 'NO', 'N', '0', 0, False]]
+    t_rows, f_rows = _split(records)
     # Index on second column and self-compare within blocks
     t_indices = sim.Indices([("Key", block.Index, lambda r: [r[1]])], t_rows)
     f_indices = sim.Indices([("Key", block.Index, lambda r: [r[1]])], f_rows)
@@ -1,8 +1,13 @@
-"""Geographic distance and similarity"""
+"""Geographic distance, similarity and grid index"""
 
 from __future__ import division
+import logging
 import math
 
+LOG = logging.getLogger('dedupe.geo')
+
+EARTH_RADIUS = 6372.0  # kilometres
+
 
 def getter(latfield, lonfield):
     """Build a field getter for (latitude, longitude) coordinates.
@@ -81,11 +86,14 @@ def distance(loc1, loc2):
     111.21237993706758
     >>> geo.distance((0.0, 0.0), (0.0, 1.0))
     111.21237993706758
+    >>> # a degree of longitude is shorter away from the equator
+    >>> round(geo.distance((60.0, 0.0), (60.0, 1.0)), 2)
+    55.61
     """
-    earth_radius = 6372.0
+    earth_radius = EARTH_RADIUS
     deg2rad = math.pi / 180.0
-    long1, lat1 = loc1[0] * deg2rad, loc1[1] * deg2rad
-    long2, lat2 = loc2[0] * deg2rad, loc2[1] * deg2rad
+    lat1, long1 = loc1[0] * deg2rad, loc1[1] * deg2rad
+    lat2, long2 = loc2[0] * deg2rad, loc2[1] * deg2rad
     cosine_distance = (math.cos(long1 - long2)
                        * math.cos(lat1) * math.cos(lat2)
                        + math.sin(lat1) * math.sin(lat2))
@@ -142,3 +150,224 @@ class Similarity:
             return 0.0
         else:
             return 1.0 - (dist - self.near) / (self.far - self.near)
+
+
+class Index(dict):
+    """Mapping from latitude/longitude grid cell to the records located in
+    that cell, comparing records in neighbouring cells that are within
+    `far` kilometres of each other.
+
+    The grid rows are `far` kilometres high, and each row is divided into
+    cells at least as wide as the longitude difference that `far` can span
+    within the row, so every pair of points within `far` kilometres is in
+    the same or neighbouring cells.  Records without valid coordinates
+    (see :func:`valid`) are not indexed.
+
+    To change `far` in an index strategy, use :func:`functools.partial` to
+    create the index type.
+
+    :type makekey: function(`R`) (:class:`float`, :class:`float`)
+    :param makekey: Gets the coordinates of a record, such as from\
+    :func:`getter`.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type far: :class:`float`
+    :param far: Compare pairs of records at most this many kilometres\
+    apart, as for :class:`Similarity`.
+
+    >>> from dedupe import geo
+    >>> makekey = geo.getter(1, 2)
+    >>> compare = lambda x, y: round(geo.distance(makekey(x), makekey(y)), 2)
+    >>> records = [('A', 0.0, 0.0), ('B', 0.0, 0.02), ('C', 1.0, 1.0),
+    ...            ('D', 10.0, 179.99), ('E', 10.0, -179.99), ('F', 'x', 1)]
+    >>> idx = geo.Index(makekey, records, far=5.0)
+    >>> sorted(idx.compare(compare).items())
+    [((('A', 0.0, 0.0), ('B', 0.0, 0.02)), 2.22),\
+ ((('D', 10.0, 179.99), ('E', 10.0, -179.99)), 2.19)]
+    >>> other = geo.Index(makekey, [('G', 1.01, 1.0)], far=5.0)
+    >>> idx.compare(compare, other)
+    {(('C', 1.0, 1.0), ('G', 1.01, 1.0)): 1.11}
+    """
+
+    def __init__(self, makekey, records=None, far=3.0):
+        super(Index, self).__init__()
+        self.makekey = makekey
+        self.far = far
+        self.skipped = 0
+        self.radius = far / EARTH_RADIUS  # angular radius in radians
+        self.height = math.degrees(self.radius)  # row height in degrees
+        self.nrows = max(1, int(math.ceil(180.0 / self.height)))
+        self.ncells = [int(360.0 // self._span(row, row))
+                       if self._span(row, row) < 180.0 else 1
+                       for row in range(self.nrows)]
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def _maxlat(self, row):
+        """Largest absolute latitude in a grid row, in radians."""
+        low = -90.0 + row * self.height
+        high = min(90.0, low + self.height)
+        return math.radians(max(abs(low), abs(high)))
+
+    def _span(self, row1, row2):
+        """Largest longitude difference in degrees between points in rows
+        `row1` and `row2` that are within `far` kilometres, from the
+        haversine formula: hav(d) >= cos(lat1) cos(lat2) hav(dlon)."""
+        cosine = math.cos(max(self._maxlat(row1), self._maxlat(row2)))
+        ratio = math.sin(self.radius / 2) / cosine if cosine > 0 else 1.0
+        if ratio >= 1.0:
+            return 360.0
+        return math.degrees(2 * math.asin(ratio))
+
+    def cell(self, coords):
+        """Grid (row, column) cell of (latitude, longitude) coordinates."""
+        lat, lon = coords
+        row = min(self.nrows - 1, int((lat + 90.0) // self.height))
+        ncells = self.ncells[row]
+        return row, int((lon + 180.0) // (360.0 / ncells)) % ncells
+
+    def neighbours(self, cell):
+        """Cells that may contain points within `far` kilometres of
+        points in `cell`, including `cell` itself."""
+        row, col = cell
+        width = 360.0 / self.ncells[row]
+        west, east = -180.0 + col * width, -180.0 + (col + 1) * width
+        result = []
+        for nrow in range(max(0, row - 1), min(self.nrows, row + 2)):
+            span, ncells = self._span(row, nrow), self.ncells[nrow]
+            nwidth = 360.0 / ncells
+            first = int((west - span + 180.0) // nwidth)
+            last = int((east + span + 180.0) // nwidth)
+            if span >= 180.0 or last - first + 1 >= ncells:
+                cols = range(ncells)
+            else:
+                cols = sorted(set(c % ncells for c in range(first, last + 1)))
+            result.extend((nrow, ncol) for ncol in cols)
+        return result
+
+    def insert(self, record):
+        """Insert a record into the cell of its coordinates, or skip it if
+        the coordinates are not valid.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [(`int`, `int`)]
+        :return: Cell in which the record was inserted, if any.
+        """
+        coords = self.makekey(record)
+        if not valid(coords):
+            self.skipped += 1
+            return []
+        cell = self.cell(coords)
+        self.setdefault(cell, []).append(record)
+        return [cell]
+
+    def records_for(self, cell):
+        """List of the records in `cell`."""
+        return self[cell]
+
+    def itergroups(self):
+        """Iterate over (cell, records) for each occupied cell."""
+        return self.iteritems()
+
+    def _cellpairs(self, other=None):
+        """Generate pairs of neighbouring occupied cells, each pair once
+        within one index."""
+        if other is None or other is self:
+            for cell in sorted(self.iterkeys()):
+                for ncell in self.neighbours(cell):
+                    if ncell >= cell and ncell in self:
+                        yield self[cell], self[ncell], ncell == cell
+        else:
+            if other.far != self.far:
+                raise ValueError("Indices have different grids")
+            for cell in sorted(self.iterkeys()):
+                for ncell in self.neighbours(cell):
+                    if ncell in other:
+                        yield self[cell], other[ncell], False
+
+    def pairs(self, other=None):
+        """Generate the pairs of records in neighbouring cells that are
+        within `far` kilometres of each other.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        getter = self.makekey
+        other_getter = getter if other is None else other.makekey
+        selfpairs = other is None or other is self
+        for records1, records2, same in self._cellpairs(other):
+            for j, b in enumerate(records2):
+                bcoords = other_getter(b)
+                for a in (records1[:j] if same else records1):
+                    if distance(getter(a), bcoords) > self.far:
+                        continue
+                    if selfpairs and b < a:
+                        yield b, a
+                    else:
+                        yield a, b
+
+    def count(self, other=None):
+        """Return upper bound on the number of comparisons required by this
+        index, counting all pairs of records in neighbouring cells.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        comparisons = 0
+        for records1, records2, same in self._cellpairs(other):
+            if same:
+                comparisons += len(records1) * (len(records1) - 1) // 2
+            else:
+                comparisons += len(records1) * len(records2)
+        return comparisons
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records within `far` kilometres of each
+        other. By default against itself, and optionally against another
+        index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about cell occupancy, prefixing with `name`.
+
+        >>> from dedupe import geo
+        >>> idx = geo.Index(geo.getter(0, 1), [(1.0, 1.0), (1.0, 1.001),
+        ...                                    (5.0, 5.0), ('', 0.0)])
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("GeoIdx")
+        name=IdxSize idx=GeoIdx recs=3 cells=2 max=2 avg=1.50 skipped=1
+        """
+        if self:
+            records = sum(len(recs) for recs in self.itervalues())
+            largest = max(len(recs) for recs in self.itervalues())
+            LOG.info("name=IdxSize idx=%s recs=%s cells=%s max=%s avg=%.2f "
+                     "skipped=%s", name, records, len(self), largest,
+                     records / len(self), self.skipped)
+        else:
+            LOG.info("name=EmptyIndex idx=%s skipped=%s", name, self.skipped)
@@ -12,6 +12,48 @@ import logging
 LOG = logging.getLogger('dedupe.group')
 
 
+class UnionFind(dict):
+    """Disjoint sets of nodes, for merging matches as they are found rather
+    than grouping them afterwards with :func:`components`.  Maps each
+    merged node to its parent node, and nodes that were never merged are
+    absent and each in a set of their own.
+
+    >>> from dedupe import group
+    >>> sets = group.UnionFind()
+    >>> sets.union(1, 2), sets.union(3, 2), sets.union(1, 3)
+    (True, True, False)
+    >>> sets.find(3) == sets.find(1), sets.find(4) == sets.find(1)
+    (True, False)
+    """
+
+    def __init__(self):
+        super(UnionFind, self).__init__()
+        self.sizes = {}
+
+    def find(self, node):
+        """Representative node of the set containing `node`."""
+        parent = self.get(node, node)
+        while parent != node:
+            grandparent = self.get(parent, parent)
+            self[node] = grandparent  # path halving
+            node, parent = grandparent, self.get(grandparent, grandparent)
+        return node
+
+    def union(self, node1, node2):
+        """Merge the sets containing `node1` and `node2`, returning
+        :keyword:`False` if they were already in the same set."""
+        root1, root2 = self.find(node1), self.find(node2)
+        if root1 == root2:
+            return False
+        size1, size2 = self.sizes.get(root1, 1), self.sizes.get(root2, 1)
+        if size1 < size2:
+            root1, root2 = root2, root1
+        self[root2] = root1
+        self.sizes[root1] = size1 + size2
+        self.sizes.pop(root2, None)
+        return True
+
+
 def adjacency_list(nodepairs):
     """Construct adjacency list from edge list provided as pairs of nodes.
     Nodes not listed in the edge list (thus not adjacent to anything) are
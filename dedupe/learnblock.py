@@ -0,0 +1,160 @@
+"""Learn a blocking scheme from labelled example pairs
+
+Choosing the index strategy by hand tends to leave redundant indices that
+multiply the comparisons without finding more matches.  Here each
+candidate key function (from :func:`keyfuncs`, built on :mod:`encode` and
+:mod:`dmetaphone`) is evaluated by the matching example pairs that share
+a key (its recall) and the pairs of records it puts in the same block
+(its cost).  A greedy weighted set cover then picks the key with the most
+newly covered matches per new candidate pair, until the target recall is
+reached, and returns the chosen keys as a strategy of :class:`block.Index`
+ready for :class:`~sim.Indices` or :class:`~linkcsv.LinkCSV`.
+"""
+
+import logging
+import dedupe.block as block
+import dedupe.encode as encode
+import dedupe.get as get
+
+LOG = logging.getLogger('dedupe.learnblock')
+
+
+def _words(text):
+    """Words of the text."""
+    return text.split()
+
+
+def _metaphones(text):
+    """Double metaphone codes of each word of the text."""
+    return [code for word in text.split()
+            for code in encode.dmetaphone(word) if code]
+
+
+# Named encoders for keyfuncs, from normalised text to a list of keys
+ENCODERS = [
+    ("Exact", lambda text: [text]),
+    ("NoSpace", lambda text: [encode.nospace(text)]),
+    ("Sorted", lambda text: [encode.sorted_words(text)]),
+    ("Prefix", lambda text: [encode.nospace(text)[:4]]),
+    ("Digits", lambda text: [encode.digits(text)]),
+    ("Words", _words),
+    ("Metaphone", _metaphones),
+]
+
+
+def keyfuncs(fields, encoders=ENCODERS):
+    """Build candidate key functions for each field with each encoder.
+
+    :type fields: [:class:`str` or :class:`int` or :class:`function`, ...]
+    :param fields: how to :func:`~get.getter` each field.
+    :type encoders: [(:class:`str`, function(:class:`unicode`) [`K`, ...])]
+    :param encoders: named encoders of normalised text into keys.
+    :rtype: [(:class:`str`, function(`R`) [`K`, ...]), ...]
+    :return: named key functions, without empty keys.
+
+    >>> from dedupe import learnblock
+    >>> funcs = dict(learnblock.keyfuncs(['Name']))
+    >>> sorted(funcs)
+    ['NameDigits', 'NameExact', 'NameMetaphone', 'NameNoSpace',\
+ 'NamePrefix', 'NameSorted', 'NameWords']
+    >>> funcs['NameMetaphone']({'Name': 'Smith, Joe'})
+    ['SM0', 'XMT', 'J', 'A']
+    >>> funcs['NameDigits']({'Name': 'Smith, Joe'})
+    []
+    """
+    def keyfunc(getfield, encoder):
+        """Key function applying `encoder` to the normalised field."""
+        def makekey(record):
+            """Non-empty keys of the encoded field value."""
+            value = getfield(record)
+            text = encode.alnumsp(unicode(value)) if value else None
+            if not text:
+                return []
+            return [key for key in encoder(text) if key]
+        return makekey
+    return [(str(field) + name, keyfunc(get.getter(field), encoder))
+            for field in fields for name, encoder in encoders]
+
+
+def learn(candidates, matches, records, recall=0.95):
+    """Choose the key functions covering `recall` of the matching pairs
+    with the fewest candidate pairs among `records`.
+
+    :type candidates: [(:class:`str`, function(`R`) [`K`, ...]), ...]
+    :param candidates: named key functions, such as from :func:`keyfuncs`.
+    :type matches: [(`R`, `R`), ...]
+    :param matches: pairs of matching records, such as from\
+       :func:`~classification.examples.pairs`.
+    :type records: [`R`, ...]
+    :param records: records (or a sample) on which to count candidate pairs.
+    :type recall: :class:`float`
+    :param recall: fraction of `matches` that the scheme should cover.
+    :rtype: [(:class:`str`, :class:`type`, function), ...], :class:`int`,\
+       :class:`float`
+    :return: index strategy, the number of distinct candidate pairs it\
+       produces among `records`, and the fraction of `matches` it covers.
+
+    >>> from dedupe import learnblock
+    >>> from dedupe.classification import examples
+    >>> records = [
+    ...  ('TRUE', '1', 'Joe Bloggs'), ('TRUE', '1', 'Bloggs, Joe'),
+    ...  ('TRUE', '2', 'Mary Smith'), ('TRUE', '2', 'Mary Smyth'),
+    ...  ('FALSE', '3', 'Joe Smith'), ('FALSE', '3', 'Mary Bloggs')]
+    >>> matches, nonmatches = examples.pairs(records)
+    >>> candidates = learnblock.keyfuncs([2])
+    >>> strategy, comparisons, covered = learnblock.learn(
+    ...     candidates, matches, records, recall=1.0)
+    >>> [name for name, indextype, makekey in strategy]
+    ['2Sorted', '2Prefix']
+    >>> comparisons, covered
+    (4, 1.0)
+    """
+    costs, covers = {}, {}
+    for name, makekey in candidates:
+        costs[name] = set(block.Index(makekey, records).pairs())
+        covers[name] = set(i for i, (a, b) in enumerate(matches)
+                           if set(makekey(a)).intersection(makekey(b)))
+    chosen, covered, generated = [], set(), set()
+    target = recall * len(matches)
+    while len(covered) < target:
+        best = None
+        for name, makekey in candidates:
+            gain = len(covers[name] - covered)
+            if gain:
+                cost = len(costs[name] - generated)
+                score = (float(gain) / max(cost, 1), gain)
+                if best is None or score > best[0]:
+                    best = (score, name, makekey)
+        if best is None:
+            break  # no key covers any of the remaining matches
+        score, name, makekey = best
+        covered |= covers[name]
+        generated |= costs[name]
+        chosen.append((name, block.Index, makekey))
+        LOG.info("name=LearnBlock key=%s covered=%s matches=%s pairs=%s",
+                 name, len(covered), len(matches), len(generated))
+    achieved = float(len(covered)) / len(matches) if matches else 1.0
+    return chosen, len(generated), achieved
+
+
+def fromexamples(records, fields, recall=0.95, sample=None):
+    """Learn a blocking scheme from example records in the format of
+    :func:`~classification.examples.load`.
+
+    :type records: [('TRUE'|'FALSE', `key`, `value`, ...), ...]
+    :param records: training records with match & key in first two fields.
+    :type fields: [:class:`str` or :class:`int` or :class:`function`, ...]
+    :param fields: fields from which to build candidate keys.
+    :type recall: :class:`float`
+    :param recall: fraction of the matching pairs that the scheme should\
+       cover.
+    :type sample: [`R`, ...]
+    :param sample: records on which to count candidate pairs, by default\
+       the example records.
+    :return: as for :func:`learn`.
+    """
+    from dedupe.classification import examples
+    matches = examples.pairs(records)[0]
+    if sample is None:
+        sample = [r for r in records if r[0] != '']
+    return learn(keyfuncs(fields), matches, sample, recall)
@@ -1,6 +1,7 @@
 """Helpers for record linkage with CSV files for input and output"""
 
 import contextlib as ctx
+import itertools
 import logging
 import os
 from os.path import join
@@ -37,7 +38,9 @@ def write_indices(indices, outdir, prefix):
     def write_index(index, stream):
         """Write a single index in CSV format to a stream"""
         writer = csv.Writer(stream)
-        for indexkey, rows in index.iteritems():
+        original = getattr(index, "original", lambda key: key)
+        for indexkey, rows in index.itergroups():
+            indexkey = original(indexkey)
             for row in rows:
                 writer.writerow([unicode(indexkey)]
                                 + [unicode(v) for v in row])
@@ -157,19 +160,42 @@ class LinkCSV(object):
     :param records: input records for linkage analysis
     :type odir: :class:`str` or :keyword:`None`
     :param odir: Directory in which to place output files and log files.
-    :type master: [`R`, ...]
-    :param master: master records to which `records` should be linked.
+    :type master: [`R`, ...] or :class:`~sim.Indices`
+    :param master: master records to which `records` should be linked, or\
+    master indices opened with :meth:`~sim.Indices.load` (the indices must\
+    have a record table, as do :class:`~block.MappedIndex` indices).
     :type logname: :class:`str` or :keyword:`None`
     :param logname: Name of log file to write to in output directory.
+    :type processes: :class:`int` or :keyword:`None`
+    :param processes: Number of worker processes for comparing pairs\
+    (see :meth:`~sim.Indices.compare`).
+    :type prune: :class:`~metablock.Pruner` or :keyword:`None`
+    :param prune: Meta-blocking stage selecting which candidate pairs to\
+    compare (see :meth:`~sim.Indices.compare`).
+    :type k: :class:`int` or :keyword:`None`
+    :param k: Keep only the `k` best compared pairs of each input record,\
+    ranked by :func:`~sim.total` of the similarity vectors.
+    :type confident: function([`float`, ...]) `bool` or :keyword:`None`
+    :param confident: Skip comparing records already linked through pairs\
+    passing this test (see :meth:`~sim.Indices.compare`).
+    :type audit: :class:`bool`
+    :param audit: With `confident`, compare the skipped pairs anyway.
+    :type budget: :class:`~progressive.Budget` or :keyword:`None`
+    :param budget: Compare the likely matches first and stop when the\
+    time or comparisons run out, classifying the pairs compared so far.
 
     :type indeces1, indeces2: :class:`~sim.Indeces`
     :ivar indeces1, indeces2: Indexed input and master records.
     :type matches, nonmatches: {(`R`, `R`)::class:`float`}
     :ivar matches, nonmatches: classifier scores of matched/nonmatched pairs.
+    :type unexplored: [((`R`, `R`), :class:`float`), ...]
+    :ivar unexplored: with `budget`, candidate pairs left uncompared.
     """
 
     def __init__(self, outdir, indexstrategy, comparator, classifier, records,
-                 master=None, logname='linkage.log'):
+                 master=None, logname='linkage.log', processes=None,
+                 prune=None, k=None, confident=None, audit=False,
+                 budget=None):
         """
         :rtype: {(R, R):float}, {(R, ):float}
         :return: classifier scores for match pairs and non-match pairs
@@ -178,19 +204,26 @@ class LinkCSV(object):
         self.indexstrategy = indexstrategy
         self.classifier = classifier
         self.records1 = records
-        self.records2 = master if master else []
         self.outdir = outdir
         if self.outdir is not None and logname is not None:
             filelog(self.opath(logname))
         # Index the records and print the stats
         self.indices1 = sim.Indices(self.indexstrategy, self.records1)
         self.indices2 = None
-        if self.records2:
-            self.indices2 = sim.Indices(self.indexstrategy, self.records2)
+        if isinstance(master, sim.Indices):
+            self.indices2 = master
+            self.records2 = master.records
+        else:
+            self.records2 = master if master else []
+            if self.records2:
+                self.indices2 = sim.Indices(self.indexstrategy, self.records2)
         # Compute the similarity vectors
         self.indices1.log_comparisons(self.indices2)
         self.comparisons = self.indices1.compare(
-            self.comparator, self.indices2)
+            self.comparator, self.indices2, processes=processes,
+            prune=prune, k=k, confident=confident, audit=audit,
+            budget=budget)
+        self.unexplored = budget.unexplored if budget is not None else []
         # Classify the similarity vectors
         self.matches, self.nonmatches = classifier(self.comparisons)
 
@@ -235,6 +268,8 @@ class LinkCSV(object):
         self.write_match_pairs()
         self.write_nonmatch_pairs()
         self.write_groups()
+        if self.unexplored:
+            self.write_unexplored()
 
     def write_records(
         self, inputrecs="input-records.csv", masterrecs="input-master.csv"):
@@ -281,10 +316,24 @@ class LinkCSV(object):
                 o_comps, _.comparator, _.comparisons, _.nonmatches,
                 _.indices1, _.indices2, self.projection, o_pairs)
 
+    def write_unexplored(self, pairs="unexplored-pairs.csv"):
+        """Write the candidate pairs left uncompared by the `budget`, most
+        likely matches first, each preceded by its schedule priority."""
+        with open(self.opath(pairs), 'wb') as ostream:
+            writer = csv.Writer(ostream)
+            projection = self.projection
+            if projection:
+                writer.writerow(["Priority"] + projection.fields)
+            else:
+                projection = lambda x: x  # no transformation
+            for (rec1, rec2), priority in self.unexplored:
+                writer.writerow((unicode(priority),) + projection(rec1))
+                writer.writerow((u"",) + projection(rec2))
+
     def write_groups(self, groups="groups.csv"):
         """Write out all records, with numbered groups of mutually linked
         records first."""
         with open(self.opath(groups), 'wb') as ofile:
             group.write_csv(
-                self.matches, self.records1 + self.records2,
+                self.matches, itertools.chain(self.records1, self.records2),
                 ofile, self.projection)
@@ -0,0 +1,251 @@
+"""MinHash locality-sensitive hashing index for sets of tokens
+
+Each record is reduced to a set of tokens (such as the words or q-grams of
+a company name), and a MinHash signature of `bands` x `rows` values is
+computed from the tokens.  Records go into one bucket per band, keyed on
+the `rows` signature values of that band, and records sharing a bucket are
+compared.  A pair of records whose token sets have Jaccard similarity `s`
+shares at least one bucket with probability ``1 - (1 - s**rows)**bands``
+(see :func:`probability`), which rises steeply around the threshold chosen
+by :func:`bands_for`.
+"""
+
+import logging
+import random
+
+from dedupe.block import hashkey
+
+LOG = logging.getLogger('dedupe.lsh')
+
+_PRIME = (1 << 61) - 1  # Mersenne prime for the universal hash functions
+_MASK = (1 << 32) - 1
+
+
+def probability(jaccard, bands, rows):
+    """Probability that two records with the given Jaccard similarity share
+    a bucket.
+
+    >>> from dedupe import lsh
+    >>> round(lsh.probability(0.8, 20, 5), 4)
+    0.9996
+    >>> round(lsh.probability(0.2, 20, 5), 4)
+    0.0064
+    """
+    return 1.0 - (1.0 - jaccard ** rows) ** bands
+
+
+def bands_for(threshold, hashes):
+    """Choose the number of bands and rows per band using at most `hashes`
+    hash functions, so that the Jaccard similarity at which pairs become
+    likely to be compared, ``(1/bands)**(1/rows)``, is close to `threshold`.
+
+    :type threshold: :class:`float`
+    :param threshold: Target Jaccard similarity, between 0.0 and 1.0.
+    :type hashes: :class:`int`
+    :param hashes: Maximum number of MinHash functions.
+    :rtype: (:class:`int`, :class:`int`)
+    :return: Number of bands and number of rows per band.
+
+    >>> from dedupe import lsh
+    >>> lsh.bands_for(0.5, 100)
+    (21, 4)
+    >>> lsh.bands_for(0.8, 100)
+    (10, 10)
+    """
+    if not 0.0 < threshold < 1.0:
+        raise ValueError("threshold: {0}".format(threshold))
+    best = None
+    for bands in range(1, hashes + 1):
+        rows = hashes // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1:]
+
+
+class Index(dict):
+    """Mapping from (band, band signature) bucket to records, comparing
+    records that share a bucket.
+
+    To change the parameters in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [`K`, ...]
+    :param makekey: Generates the tokens for the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type threshold: :class:`float`
+    :param threshold: Target Jaccard similarity for choosing `bands` and\
+    `rows` with :func:`bands_for`.
+    :type hashes: :class:`int`
+    :param hashes: Number of MinHash functions available to :func:`bands_for`.
+    :type bands, rows: :class:`int`
+    :param bands, rows: Explicit number of bands and rows per band,\
+    overriding `threshold` and `hashes`.
+    :type seed: :class:`int`
+    :param seed: Seed for generating the hash functions. Indices compared\
+    with each other must use the same seed.
+
+    >>> from dedupe import get, lsh
+    >>> makekey = get.multivalue(' ', 1)
+    >>> compare = lambda x, y: float(x[1] == y[1])
+    >>> records = [('A', 'acme widget co'), ('B', 'acme widget company'),
+    ...            ('C', 'zebra stripes inc')]
+    >>> idx = lsh.Index(makekey, records, bands=10, rows=2)
+    >>> idx.compare(compare)
+    {(('A', 'acme widget co'), ('B', 'acme widget company')): 0.0}
+    >>> other = lsh.Index(makekey, [('D', 'zebra stripes inc')],
+    ...                   bands=10, rows=2)
+    >>> idx.compare(compare, other)
+    {(('C', 'zebra stripes inc'), ('D', 'zebra stripes inc')): 1.0}
+    """
+
+    def __init__(self, makekey, records=None, threshold=0.5, hashes=100,
+                 bands=None, rows=None, seed=0):
+        super(Index, self).__init__()
+        self.makekey = makekey
+        if bands is None or rows is None:
+            bands, rows = bands_for(threshold, hashes)
+        self.bands = bands
+        self.rows = rows
+        rand = random.Random(seed)
+        self.hashes = [
+            (rand.randint(1, _PRIME - 1), rand.randint(0, _PRIME - 1))
+            for _ in range(bands * rows)]
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def signature(self, tokens):
+        """MinHash signature of a set of tokens.
+
+        :type tokens: [`K`, ...]
+        :param tokens: Tokens of a record.
+        :rtype: [:class:`int`, ...]
+        :return: Minimum of each hash function over the tokens, which is\
+        the same in every process, as the tokens are hashed with\
+        :func:`~block.hashkey` rather than :func:`hash`.
+
+        >>> from dedupe import lsh
+        >>> lsh.Index(None, bands=1, rows=2).signature(['acme', 'widget'])
+        [1407902489756355776L, 471473922614930502L]
+        """
+        hashed = [hashkey(token) & _MASK for token in set(tokens)]
+        return [min((a * h + b) % _PRIME for h in hashed)
+                for a, b in self.hashes]
+
+    def buckets(self, record):
+        """Buckets of the record, one per band, or none if the record
+        has no tokens."""
+        tokens = self.makekey(record)
+        if not tokens:
+            return []
+        sig, rows = self.signature(tokens), self.rows
+        return [(band, tuple(sig[band * rows:(band + 1) * rows]))
+                for band in range(self.bands)]
+
+    def insert(self, record):
+        """Insert a record into the bucket of each band.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [(`int`, (`int`, ...)), ...]
+        :return: Buckets in which the record was inserted.
+        """
+        keys = self.buckets(record)
+        for key in keys:
+            self.setdefault(key, []).append(record)
+        return keys
+
+    def records_for(self, key):
+        """List of the records in bucket `key`."""
+        return self[key]
+
+    def itergroups(self):
+        """Iterate over (bucket, records) for each bucket in the index."""
+        return self.iteritems()
+
+    def pairs(self, other=None):
+        """Generate the pairs of records that share a bucket. A pair may be
+        generated once for each band in which the records collide.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        if other is None or other is self:
+            for records in self.itervalues():
+                for j in range(len(records)):
+                    for i in range(j):
+                        a, b = records[i], records[j]
+                        yield (a, b) if a <= b else (b, a)
+        else:
+            if other.hashes != self.hashes or other.rows != self.rows:
+                raise ValueError("Indices have different hash functions")
+            for key, records in self.iteritems():
+                if key in other:
+                    for rec2 in other[key]:
+                        for rec1 in records:
+                            yield rec1, rec2
+
+    def count(self, other=None):
+        """Return upper bound on the number of comparisons required by this
+        index. The actual number of comparison function calls will be lower
+        due to pairs colliding in more than one band.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        if other is None or other is self:
+            return sum(len(recs) * (len(recs) - 1) // 2
+                       for recs in self.itervalues())
+        else:
+            return sum(len(recs) * len(other[key])
+                       for key, recs in self.iteritems() if key in other)
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records sharing a bucket. By default
+        against itself, and optionally against another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about bucket sizes, prefixing with `name`.
+
+        >>> from dedupe import get, lsh
+        >>> idx = lsh.Index(get.multivalue(' ', 0), [('a b',), ('a b',)],
+        ...                 bands=4, rows=2)
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("LshIdx")
+        name=IdxSize idx=LshIdx buckets=4 max=2 avg=2.00 bands=4 rows=2
+        """
+        if self:
+            entries = sum(len(recs) for recs in self.itervalues())
+            largest = max(len(recs) for recs in self.itervalues())
+            LOG.info("name=IdxSize idx=%s buckets=%s max=%s avg=%.2f "
+                     "bands=%s rows=%s", name, len(self), largest,
+                     float(entries) / len(self), self.bands, self.rows)
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
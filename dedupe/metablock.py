@@ -0,0 +1,267 @@
+"""Meta-blocking: prune the candidate pairs of several indices
+
+With several indices, many candidate pairs share only one large block and
+almost never match, while matching pairs tend to share several small
+blocks.  Meta-blocking (Papadakis et al., 2014) builds the blocking graph,
+with an edge for each candidate pair weighted by the blocks that the pair
+has in common, and compares only the pairs on the heavier edges.
+
+The edge weights (see :class:`Graph`) are:
+
+- ``cbs``: number of common blocks.
+- ``ecbs``: common blocks, scaled up for records in few blocks.
+- ``jaccard``: common blocks over the blocks containing either record.
+- ``arcs``: sum over common blocks of 1 / comparisons in the block,\
+  so that small blocks count for more.
+
+The pruning schemes (see :meth:`Graph.prune`) are:
+
+- ``wep``: weighted edge pruning keeps the edges weighing at least the mean.
+- ``cnp``: cardinality node pruning keeps the `k` heaviest edges of each\
+  record, by default `k` is one less than the average number of blocks\
+  per record, and at least 1.
+"""
+
+from __future__ import division
+import logging
+import math
+
+LOG = logging.getLogger('dedupe.metablock')
+
+WEIGHTS = ("cbs", "ecbs", "jaccard", "arcs")
+SCHEMES = ("wep", "cnp")
+
+
+def blocks(index, other=None):
+    """Generate the blocks of an index, so that the pairs of the blocks
+    are the pairs that the index compares.  The blocks of a
+    :class:`~block.Index` decide its pairs, but other index types, such as
+    :mod:`~dedupe.qgram` or :mod:`~dedupe.geo`, check the pairs of their
+    blocks or pair records across blocks, so each distinct pair that their
+    `pairs` method generates is a block of its own.
+
+    :type index: :class:`~block.Index` or similar index
+    :param index: Index whose blocks to generate.
+    :type other: :class:`~block.Index` or similar index
+    :param other: Pair up blocks with the blocks of the same key in `other`.
+    :rtype: iter [[`R`, ...], ...] or iter [([`R1`, ...], [`R2`, ...])]
+    :return: Lists of records, or pairs of lists of records for two indices.
+
+    >>> from dedupe import metablock, qgram
+    >>> records = [('A', 'smith'), ('B', 'smyth'), ('C', 'jones')]
+    >>> idx = qgram.Index(qgram.getter(1), records, overlap=3)
+    >>> list(idx.pairs())
+    [(('A', 'smith'), ('B', 'smyth'))]
+    >>> list(metablock.blocks(idx))
+    [[('A', 'smith'), ('B', 'smyth')]]
+    """
+    # storedkeys is None for block.Index types that verify their pairs
+    if getattr(index, "storedkeys", None) is not None:
+        return index.blocks(other)
+    if not hasattr(index, "pairs"):
+        raise TypeError("{0!r}: does not support pairs.".format(type(index)))
+    return _pairblocks(index, other)
+
+
+def _pairblocks(index, other=None):
+    """Each distinct pair of the index as a block of its own."""
+    single = other is None or other is index
+    seen = set()
+    for a, b in index.pairs(None if single else other):
+        if single:
+            if a is b:
+                continue
+            key = (min(id(a), id(b)), max(id(a), id(b)))
+        else:
+            key = (id(a), id(b))
+        if key not in seen:
+            seen.add(key)
+            yield [a, b] if single else ([a], [b])
+
+
+class Graph(dict):
+    """Blocking graph of several indices, mapping each candidate pair of
+    records to the weight of its edge.
+
+    :type indices: :class:`~sim.Indices`
+    :param indices: Indices whose blocks make up the graph.
+    :type other: :class:`~sim.Indices`
+    :param other: Another Indices to pair records with.
+    :type weight: :class:`str`
+    :param weight: Edge weighting scheme, one of :data:`WEIGHTS`.
+
+    :type nblocks: :class:`int`
+    :ivar nblocks: Number of blocks having at least one candidate pair.
+    :type nodeblocks: {`R`: :class:`int`}, {`R`: :class:`int`}
+    :ivar nodeblocks: Number of blocks containing each record of `indices`\
+    and of `other`.
+
+    >>> from dedupe import block, metablock, sim
+    >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+    ...             ("Name", block.Index, lambda r: [r[0]])]
+    >>> records = [('A', 5.5), ('A', 5.2), ('B', 5.0), ('C', 6.0)]
+    >>> indices = sim.Indices(strategy, records)
+    >>> graph = metablock.Graph(indices, weight="cbs")
+    >>> sorted(graph.items())
+    [((('A', 5.2), ('A', 5.5)), 2),\
+ ((('A', 5.2), ('B', 5.0)), 1),\
+ ((('A', 5.5), ('B', 5.0)), 1)]
+    >>> graph = metablock.Graph(indices, weight="jaccard")
+    >>> round(graph[(('A', 5.2), ('B', 5.0))], 2)
+    0.5
+    """
+
+    def __init__(self, indices, other=None, weight="jaccard"):
+        super(Graph, self).__init__()
+        if weight not in WEIGHTS:
+            raise ValueError("weight: {0}".format(weight))
+        self.weight = weight
+        self.nblocks = 0
+        self.nodeblocks = ({}, {})
+        counts1, counts2 = self.nodeblocks
+        common, arcs = {}, {}
+        if other is None or other is indices:
+            counts2 = counts1
+            for index in indices.itervalues():
+                # pairs in the same order as the index generates them
+                order = getattr(index, "_ordered", sorted)
+                for records in blocks(index):
+                    distinct, seen = [], set()
+                    for record in order(list(records)):
+                        if id(record) not in seen:
+                            seen.add(id(record))
+                            distinct.append(record)
+                    size = len(distinct) * (len(distinct) - 1) // 2
+                    if not size:
+                        continue
+                    self.nblocks += 1
+                    for record in distinct:
+                        counts1[record] = counts1.get(record, 0) + 1
+                    for j in xrange(1, len(distinct)):
+                        b = distinct[j]
+                        for i in xrange(j):
+                            pair = (distinct[i], b)
+                            common[pair] = common.get(pair, 0) + 1
+                            arcs[pair] = arcs.get(pair, 0) + 1 / size
+        else:
+            for index1, index2 in indices._zip(other):
+                for records1, records2 in blocks(index1, index2):
+                    size = len(records1) * len(records2)
+                    if not size:
+                        continue
+                    self.nblocks += 1
+                    for record in records1:
+                        counts1[record] = counts1.get(record, 0) + 1
+                    for record in records2:
+                        counts2[record] = counts2.get(record, 0) + 1
+                    for b in records2:
+                        for a in records1:
+                            pair = (a, b)
+                            common[pair] = common.get(pair, 0) + 1
+                            arcs[pair] = arcs.get(pair, 0) + 1 / size
+        nblocks = self.nblocks
+        for pair, shared in common.iteritems():
+            if weight == "cbs":
+                value = shared
+            elif weight == "arcs":
+                value = arcs[pair]
+            else:
+                blocks1, blocks2 = counts1[pair[0]], counts2[pair[1]]
+                if weight == "jaccard":
+                    value = shared / (blocks1 + blocks2 - shared)
+                else:
+                    value = (shared * math.log(nblocks / blocks1) *
+                             math.log(nblocks / blocks2))
+            self[pair] = value
+
+    def prune(self, scheme="wep", k=None):
+        """Select the candidate pairs on the heavier edges of the graph.
+
+        :type scheme: :class:`str`
+        :param scheme: Pruning scheme, one of :data:`SCHEMES`.
+        :type k: :class:`int` or :keyword:`None`
+        :param k: For ``cnp``, the number of edges to keep per record,\
+        by default one less than the average number of blocks per record.
+        :rtype: [(`R1`, `R2`), ...]
+        :return: Retained pairs, from heaviest to lightest edge.
+
+        >>> from dedupe import block, metablock, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> records = [('A', 5.5), ('A', 5.2), ('B', 5.0), ('C', 6.0)]
+        >>> indices = sim.Indices(strategy, records)
+        >>> graph = metablock.Graph(indices, weight="cbs")
+        >>> graph.prune("wep")
+        [(('A', 5.2), ('A', 5.5))]
+        >>> graph.prune("cnp", k=1)
+        [(('A', 5.2), ('A', 5.5)), (('A', 5.2), ('B', 5.0))]
+        """
+        if scheme not in SCHEMES:
+            raise ValueError("scheme: {0}".format(scheme))
+        heaviest = sorted(self.iteritems(), key=lambda e: (-e[1], e[0]))
+        if scheme == "wep":
+            if not heaviest:
+                return []
+            mean = sum(self.itervalues()) / len(self)
+            return [pair for pair, value in heaviest if value >= mean]
+        if k is None:
+            counts1, counts2 = self.nodeblocks
+            nodes = len(counts1) + (len(counts2) if counts2 else 0)
+            total = sum(counts1.itervalues()) + sum(counts2.itervalues())
+            k = max(1, int(total / nodes) - 1) if nodes else 1
+        kept1, kept2 = {}, {}
+        result = []
+        for pair, value in heaviest:
+            a, b = pair
+            # for a single index, both records are nodes of the same side
+            side2 = kept2 if self.nodeblocks[1] else kept1
+            if kept1.get(a, 0) < k or side2.get(b, 0) < k:
+                result.append(pair)
+            kept1[a] = kept1.get(a, 0) + 1
+            side2[b] = side2.get(b, 0) + 1
+        return result
+
+
+class Pruner(object):
+    """Meta-blocking stage for :meth:`~sim.Indices.compare`, called with
+    the indices to select the candidate pairs to compare.
+
+    :type weight: :class:`str`
+    :param weight: Edge weighting scheme, one of :data:`WEIGHTS`.
+    :type scheme: :class:`str`
+    :param scheme: Pruning scheme, one of :data:`SCHEMES`.
+    :type k: :class:`int` or :keyword:`None`
+    :param k: For ``cnp``, the number of edges to keep per record.
+
+    >>> from dedupe import block, metablock, sim
+    >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+    ...             ("Name", block.Index, lambda r: [r[0]])]
+    >>> records = [('A', 5.5), ('A', 5.2), ('B', 5.0), ('C', 6.0)]
+    >>> indices = sim.Indices(strategy, records)
+    >>> compare = lambda a, b: abs(a[1] - b[1])
+    >>> indices.compare(compare, prune=metablock.Pruner("cbs", "wep"))
+    {(('A', 5.2), ('A', 5.5)): 0.2999999999999998}
+    """
+
+    def __init__(self, weight="jaccard", scheme="wep", k=None):
+        if weight not in WEIGHTS:
+            raise ValueError("weight: {0}".format(weight))
+        if scheme not in SCHEMES:
+            raise ValueError("scheme: {0}".format(scheme))
+        self.weight = weight
+        self.scheme = scheme
+        self.k = k
+
+    def __call__(self, indices, other=None):
+        """Build the blocking graph of `indices` (against `other`) and log
+        the number of candidate pairs before and after pruning.
+
+        :rtype: [(`R1`, `R2`), ...]
+        :return: Pairs to compare, each pair once.
+        """
+        graph = Graph(indices, other, self.weight)
+        pairs = graph.prune(self.scheme, self.k)
+        LOG.info("name=MetaBlocking weight=%s scheme=%s blocks=%s "
+                 "comparisons=%s kept=%s", self.weight, self.scheme,
+                 graph.nblocks, len(graph), len(pairs))
+        return pairs
@@ -0,0 +1,265 @@
+"""Sorted-neighbourhood index that compares records with nearby keys
+
+The records are sorted on their index keys, and a window of fixed size
+slides over the sorted list so that each record is only compared to
+the next few records.  Unlike :class:`~block.Index`, keys that differ
+slightly (for example by a typo near the end) still end up next to each
+other, and a common key does not lead to a quadratic number of comparisons:
+the number of comparisons is roughly the number of keys times the window.
+
+Running several passes with different keys (such as the forward and the
+reversed name, see :func:`multipass`) catches typos near the start of
+the key as well.  The window slides over the entries of each pass
+separately.
+"""
+
+from collections import namedtuple
+import logging
+from operator import itemgetter
+
+LOG = logging.getLogger('dedupe.neighbourhood')
+
+PassKey = namedtuple("PassKey", ("passno", "key"))
+"""Key of a :func:`multipass` pass, sorting before the keys of later
+passes."""
+
+
+def multipass(*makekeys):
+    """Combine several key functions into one, so that the records are
+    sorted separately on the keys of each function (one "pass" each).
+
+    :type makekeys: function(`R`) [`K`, ...]
+    :param makekeys: Key functions for each pass.
+    :rtype: function(`R`) [:class:`PassKey`, ...]
+    :return: Key function producing keys tagged with their pass number.
+
+    >>> from dedupe import encode, neighbourhood
+    >>> makekey = neighbourhood.multipass(
+    ...     lambda r: [r[0]], lambda r: [encode.reverse(r[0])])
+    >>> makekey(('abc',))
+    [PassKey(passno=0, key='abc'), PassKey(passno=1, key='cba')]
+
+    The window does not run from the last entries of one pass into the
+    first entries of the next:
+
+    >>> makekey = neighbourhood.multipass(lambda r: [r[1]], lambda r: [r[1]])
+    >>> records = [('A', 'aaa'), ('B', 'mmm'), ('C', 'zzz')]
+    >>> idx = neighbourhood.Index(makekey, records, window=2)
+    >>> sorted(set(idx.pairs())), idx.count()
+    ([(('A', 'aaa'), ('B', 'mmm')), (('B', 'mmm'), ('C', 'zzz'))], 4)
+    """
+    def makekey(record):
+        """Keys for each pass, tagged with the pass number."""
+        return [PassKey(passno, key) for passno, func in enumerate(makekeys)
+                for key in func(record)]
+    return makekey
+
+
+def _passno(key):
+    """Pass number of a key, which is 0 unless it is a :class:`PassKey`."""
+    return key.passno if isinstance(key, PassKey) else 0
+
+
+def _passes(entries):
+    """Generate the (start, stop) range of the sorted entries of each
+    pass."""
+    start = 0
+    for j in xrange(1, len(entries)):
+        if _passno(entries[j][0]) != _passno(entries[j - 1][0]):
+            yield start, j
+            start = j
+    if entries:
+        yield start, len(entries)
+
+
+class Index(object):
+    """Sorted list of (key, record) entries, comparing each record with
+    those in the following `window` - 1 entries.
+
+    To use a window other than the default in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [`K`, ...]
+    :param makekey: Generates the index keys for the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type window: :class:`int`
+    :param window: Number of sorted entries in the sliding window.
+
+    >>> from dedupe import neighbourhood
+    >>> makekey = lambda r: [r[1]]
+    >>> compare = lambda x, y: float(x[1][:3] == y[1][:3])
+    >>> records = [('A', 'smith'), ('B', 'smyth'), ('C', 'smithe'),
+    ...            ('D', 'jones')]
+    >>> idx = neighbourhood.Index(makekey, records, window=2)
+    >>> idx.count()
+    3
+    >>> sorted(idx.compare(compare).items())
+    [((('A', 'smith'), ('C', 'smithe')), 1.0),\
+ ((('A', 'smith'), ('D', 'jones')), 0.0),\
+ ((('B', 'smyth'), ('C', 'smithe')), 0.0)]
+    >>> other = neighbourhood.Index(makekey, [('E', 'smithy')], window=2)
+    >>> idx.count(other)
+    2
+    >>> sorted(idx.compare(compare, other).items())
+    [((('B', 'smyth'), ('E', 'smithy')), 0.0),\
+ ((('C', 'smithe'), ('E', 'smithy')), 1.0)]
+    >>> from functools import partial
+    >>> from dedupe import sim
+    >>> strategy = [("Name", partial(neighbourhood.Index, window=3), makekey)]
+    >>> sim.Indices(strategy, records)["Name"].window
+    3
+    """
+
+    def __init__(self, makekey, records=None, window=5):
+        if window < 2:
+            raise ValueError("window: {0} is less than 2".format(window))
+        self.makekey = makekey
+        self.window = window
+        self.entries = []
+        self.sorted = True
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def insert(self, record):
+        """Insert a record into the index.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [`K`, ...]
+        :return: Keys under which the record was inserted.
+        """
+        keys = self.makekey(record)
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+            self.entries.append((key, record))
+        self.sorted = False
+        return keys
+
+    def sort(self):
+        """Sort the entries on the key, keeping insertion order for
+        entries having the same key."""
+        if not self.sorted:
+            self.entries.sort(key=itemgetter(0))
+            self.sorted = True
+
+    def _merged(self, other):
+        """Sorted (key, record, side) entries of both indices, where side is
+        0 for entries from `self` and 1 for entries from `other`."""
+        self.sort()
+        other.sort()
+        entries = [(k, r, 0) for k, r in self.entries]
+        entries.extend((k, r, 1) for k, r in other.entries)
+        entries.sort(key=itemgetter(0))
+        return entries
+
+    def pairs(self, other=None):
+        """Generate the pairs of records within the sliding window. A pair
+        may be generated more than once when the records have several keys.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        width = self.window - 1
+        if other is None or other is self:
+            self.sort()
+            entries = self.entries
+            for start, stop in _passes(entries):
+                for j in xrange(start + 1, stop):
+                    b = entries[j][1]
+                    for i in xrange(max(start, j - width), j):
+                        a = entries[i][1]
+                        if a is b:
+                            continue  # same record under nearby keys
+                        yield (a, b) if a <= b else (b, a)
+        else:
+            entries = self._merged(other)
+            for start, stop in _passes(entries):
+                for j in xrange(start + 1, stop):
+                    b, bside = entries[j][1:]
+                    for i in xrange(max(start, j - width), j):
+                        a, aside = entries[i][1:]
+                        if aside < bside:
+                            yield a, b
+                        elif aside > bside:
+                            yield b, a
+
+    def count(self, other=None):
+        """Return upper bound on the number of comparisons required by this
+        index. The actual number of comparison function calls will be lower
+        due to caching of comparisons.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        width = self.window - 1
+        comparisons = 0
+        if other is None or other is self:
+            self.sort()
+            for start, stop in _passes(self.entries):
+                nents = stop - start
+                if nents <= self.window:
+                    comparisons += nents * (nents - 1) // 2
+                else:
+                    comparisons += ((width * (width - 1) // 2) +
+                                    (nents - width) * width)
+        else:
+            entries = self._merged(other)
+            for start, stop in _passes(entries):
+                for j in xrange(start + 1, stop):
+                    side = entries[j][2]
+                    comparisons += sum(
+                        1 for e in entries[max(start, j - width):j]
+                        if e[2] != side)
+        return comparisons
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records within the sliding window.
+        By default against itself, and optionally against another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about the sorted entries, prefixing with `name`.
+
+        >>> from dedupe import neighbourhood
+        >>> makekey = lambda r: [r[1]]
+        >>> idx = neighbourhood.Index(makekey, [('A', 'x'), ('B', 'y')])
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("SortIdx")
+        name=IdxSize idx=SortIdx entries=2 keys=2 window=5
+        """
+        if self.entries:
+            self.sort()
+            keys = 1 + sum(1 for i in xrange(1, len(self.entries))
+                           if self.entries[i][0] != self.entries[i - 1][0])
+            LOG.info("name=IdxSize idx=%s entries=%s keys=%s window=%s",
+                     name, len(self.entries), keys, self.window)
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
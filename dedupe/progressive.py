@@ -0,0 +1,144 @@
+"""Progressive linkage: compare the likely matches first, within a budget
+
+A full linkage compares every candidate pair before returning anything, so
+a run that must finish by a deadline produces no matches at all when it
+overruns.  Progressive linkage (Papenbrock et al., 2015) instead schedules
+the candidate pairs by their estimated likelihood of matching and stops
+when a wall-clock or comparison budget runs out, so that the matches found
+so far are most of the matches.
+
+The schedule ranks the pairs on the ``arcs`` edge weights of the blocking
+graph (see :class:`~metablock.Graph`), which favour pairs sharing small
+blocks and pairs sharing blocks in several indices, optionally scaled by a
+cheap similarity of the records, such as a comparison of one field.  The
+schedule has the same pairs that the indices compare, so a budget large
+enough to finish finds the same matches as comparing without a budget.
+"""
+
+from __future__ import division
+import logging
+import time
+
+from dedupe import metablock
+
+LOG = logging.getLogger('dedupe.progressive')
+
+
+def schedule(indices, other=None, cheap=None):
+    """Order the distinct candidate pairs by estimated match likelihood.
+
+    :type indices: :class:`~sim.Indices`
+    :param indices: Indices generating the candidate pairs.
+    :type other: :class:`~sim.Indices`
+    :param other: Another Indices to pair records with.
+    :type cheap: function(`R1`, `R2`) :class:`float` or :keyword:`None`
+    :param cheap: Quick similarity of a pair, multiplying the block weight.
+    :rtype: [((`R1`, `R2`), :class:`float`), ...]
+    :return: Pairs with their priority, from most to least likely.
+
+    >>> from dedupe import block, progressive, sim
+    >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+    ...             ("Name", block.Index, lambda r: [r[0]])]
+    >>> records = [('A', 5.5), ('A', 5.2), ('B', 5.0), ('C', 5.45)]
+    >>> indices = sim.Indices(strategy, records)
+    >>> [pair for pair, _ in progressive.schedule(indices)][:2]
+    [(('A', 5.2), ('A', 5.5)), (('A', 5.2), ('B', 5.0))]
+    >>> cheap = lambda a, b: 1 - abs(a[1] - b[1])
+    >>> progressive.schedule(indices, cheap=cheap)[1][0]
+    (('A', 5.5), ('C', 5.45))
+    """
+    graph = metablock.Graph(indices, other, weight="arcs")
+    if cheap is None:
+        ranked = graph.items()
+    else:
+        ranked = [(pair, value * cheap(pair[0], pair[1]))
+                  for pair, value in graph.iteritems()]
+    ranked.sort(key=lambda e: (-e[1], e[0]))
+    return ranked
+
+
+class Budget(object):
+    """Progressive stage for :meth:`~sim.Indices.compare`, which compares
+    the pairs in the order of :func:`schedule` until either limit is
+    reached.  The clock starts when the comparison starts, and includes
+    building the schedule.
+
+    :type seconds: :class:`float` or :keyword:`None`
+    :param seconds: Wall-clock time allowed for comparing.
+    :type comparisons: :class:`int` or :keyword:`None`
+    :param comparisons: Number of pairs allowed to be compared.
+    :type cheap: function(`R1`, `R2`) :class:`float` or :keyword:`None`
+    :param cheap: Quick similarity of a pair for the schedule.
+
+    :type unexplored: [((`R1`, `R2`), :class:`float`), ...]
+    :ivar unexplored: After comparing, the scheduled pairs that were not\
+    compared, with their priority, from most to least likely.
+
+    >>> from dedupe import block, progressive, sim
+    >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+    ...             ("Name", block.Index, lambda r: [r[0]])]
+    >>> records = [('A', 5.5), ('A', 5.2), ('B', 5.0), ('C', 5.9)]
+    >>> indices = sim.Indices(strategy, records)
+    >>> compare = lambda a, b: 1 - abs(a[1] - b[1])
+    >>> budget = progressive.Budget(comparisons=2)
+    >>> sorted(indices.compare(compare, budget=budget))
+    [(('A', 5.2), ('A', 5.5)), (('A', 5.2), ('B', 5.0))]
+    >>> [pair for pair, _ in budget.unexplored]
+    [(('A', 5.2), ('C', 5.9)), (('A', 5.5), ('B', 5.0)),\
+ (('A', 5.5), ('C', 5.9)), (('B', 5.0), ('C', 5.9))]
+
+    With a budget large enough to finish, the pairs are those of comparing
+    without a budget, also for indices that pair records across blocks:
+
+    >>> from functools import partial
+    >>> from dedupe import geo
+    >>> makekey = geo.getter(1, 2)
+    >>> strategy = [("Geo", partial(geo.Index, far=5.0), makekey)]
+    >>> records = [('A', 0.0, 0.0), ('B', 0.0, 0.02), ('C', 0.0, 0.04),
+    ...            ('D', 1.0, 1.0)]
+    >>> indices = sim.Indices(strategy, records)
+    >>> budget = progressive.Budget(comparisons=100)
+    >>> sorted(indices.compare(compare, budget=budget)) == sorted(
+    ...     indices.compare(compare))
+    True
+    >>> len(budget.unexplored)
+    0
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, seconds=None, comparisons=None, cheap=None):
+        if seconds is None and comparisons is None:
+            raise ValueError("Budget requires seconds or comparisons")
+        self.seconds = seconds
+        self.comparisons = comparisons
+        self.cheap = cheap
+        self.unexplored = []
+        self.started = None
+
+    def start(self):
+        """Start the clock for the `seconds` limit."""
+        self.started = self.clock()
+
+    def elapsed(self):
+        """Seconds since :meth:`start`."""
+        return self.clock() - self.started
+
+    def schedule(self, indices, other=None):
+        """Candidate pairs in the order to compare them, see
+        :func:`schedule`."""
+        return schedule(indices, other, self.cheap)
+
+    def exhausted(self, compared):
+        """Whether no more pairs may be compared after `compared` pairs."""
+        if self.comparisons is not None and compared >= self.comparisons:
+            return True
+        return self.seconds is not None and self.elapsed() >= self.seconds
+
+    def report(self, compared):
+        """Log how far the comparison got, with the priority of the most
+        likely unexplored pair."""
+        top = self.unexplored[0][1] if self.unexplored else 0
+        LOG.info("name=Progressive compared=%s unexplored=%s seconds=%.2f "
+                 "topweight=%.4g", compared, len(self.unexplored),
+                 self.elapsed(), top)
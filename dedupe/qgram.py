@@ -0,0 +1,268 @@
+"""Inverted index on q-grams that pairs records sharing several grams
+
+Each record is split into tokens, such as the character q-grams of a name
+from :func:`getter` or its words from :func:`~get.multivalue`, and the
+index maps each token to the IDs of the records having that token.  A pair
+of records is a candidate only when the records share at least `overlap`
+tokens, so a typo only removes a few of the shared grams, while tokens
+occurring in very many records (such as "ltd" or "the") are skipped
+instead of producing huge blocks.
+"""
+
+from array import array
+import logging
+import math
+
+LOG = logging.getLogger('dedupe.qgram')
+
+
+def grams(text, q=2, pad=True):
+    """Split text into its distinct character q-grams.
+
+    :type text: :class:`unicode`
+    :param text: Text to split.
+    :type q: :class:`int`
+    :param q: Length of each gram.
+    :type pad: :class:`bool`
+    :param pad: Pad the text with `q` - 1 '#' on the left and '$' on\
+    the right, so the first and last characters contribute as many grams\
+    as the others.
+    :rtype: [:class:`unicode`, ...]
+    :return: Distinct grams in order of first occurrence.
+
+    >>> from dedupe import qgram
+    >>> qgram.grams('abab')
+    ['#a', 'ab', 'ba', 'b$']
+    >>> qgram.grams('abc', q=3, pad=False)
+    ['abc']
+    >>> qgram.grams('')
+    []
+    """
+    if not text:
+        return []
+    if pad:
+        text = '#' * (q - 1) + text + '$' * (q - 1)
+    result, seen = [], set()
+    for i in range(len(text) - q + 1):
+        gram = text[i:i + q]
+        if gram not in seen:
+            seen.add(gram)
+            result.append(gram)
+    return result
+
+
+def getter(field, q=2, pad=True):
+    """Build a key function for the q-grams of a field.
+
+    :type field: :class:`str` or :class:`int` or :class:`function`
+    :param field: how to :func:`~get.getter` the field.
+    :rtype: function(`R`) [:class:`unicode`, ...]
+    :return: Key function returning the q-grams of the field value.
+
+    >>> from dedupe import qgram
+    >>> qgram.getter(1, q=3)(('A', 'joe'))
+    ['##j', '#jo', 'joe', 'oe$', 'e$$']
+    """
+    from dedupe.get import getter as _getter
+    get = _getter(field)
+
+    def makekey(record):
+        """Q-grams of the field value."""
+        return grams(get(record), q, pad)
+    return makekey
+
+
+class Index(dict):
+    """Mapping from token to array of IDs of records having that token,
+    pairing records that share at least `overlap` tokens.
+
+    To change the parameters in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [`K`, ...]
+    :param makekey: Generates the tokens for the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type overlap: :class:`float`
+    :param overlap: Minimum number of shared tokens for a candidate pair,\
+    or minimum total weight of shared tokens when `idf` is set.
+    :type maxfreq: :class:`int` or :class:`float` or :keyword:`None`
+    :param maxfreq: Skip tokens found in more records than this. Values\
+    below 1.0 are a fraction of the number of records.
+    :type idf: :class:`bool`
+    :param idf: Weight each shared token by its inverse document frequency,\
+    log(N/df), instead of counting it as 1.
+
+    :type records: [`R`, ...]
+    :ivar records: Table of records, indexed by record ID.
+
+    >>> from dedupe import qgram
+    >>> makekey = qgram.getter(1)
+    >>> compare = lambda x, y: float(x[1] == y[1])
+    >>> records = [('A', 'smith'), ('B', 'smyth'), ('C', 'jones')]
+    >>> idx = qgram.Index(makekey, records, overlap=3)
+    >>> idx.count()
+    1
+    >>> idx.compare(compare)
+    {(('A', 'smith'), ('B', 'smyth')): 0.0}
+    >>> other = qgram.Index(makekey, [('D', 'jonas')], overlap=3)
+    >>> idx.compare(compare, other)
+    {(('C', 'jones'), ('D', 'jonas')): 0.0}
+    >>> qgram.Index(makekey, records, overlap=3, maxfreq=1).count()
+    0
+    """
+
+    def __init__(self, makekey, records=None, overlap=2, maxfreq=None,
+                 idf=False):
+        super(Index, self).__init__()
+        self.makekey = makekey
+        self.overlap = overlap
+        self.maxfreq = maxfreq
+        self.idf = idf
+        self.records = []
+        self.tokens = []
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def insert(self, record):
+        """Insert a record into the record table and its ID into the
+        postings of each of its tokens.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [`K`, ...]
+        :return: Tokens under which the record was inserted.
+        """
+        keys = self.makekey(record)
+        recid = len(self.records)
+        tokens = []
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+            ids = self.get(key)
+            if ids is None:
+                ids = self[key] = array('i')
+            if not ids or ids[-1] != recid:
+                ids.append(recid)
+                tokens.append(key)
+        self.records.append(record)
+        self.tokens.append(tuple(tokens))
+        return keys
+
+    def records_for(self, key):
+        """List of the records having token `key`, in ID order."""
+        records = self.records
+        return [records[recid] for recid in self[key]]
+
+    def itergroups(self):
+        """Iterate over (token, records) for each token in the index."""
+        for key in self.iterkeys():
+            yield key, self.records_for(key)
+
+    def _cutoff(self, nrecs):
+        """Maximum document frequency of a token for `nrecs` records."""
+        if self.maxfreq is None:
+            return nrecs
+        elif self.maxfreq < 1.0:
+            return self.maxfreq * nrecs
+        return self.maxfreq
+
+    def _candidates(self, tokens, postings, nrecs, before=None):
+        """Map IDs of records sharing enough of `tokens` to the weight of
+        the shared tokens. Only IDs below `before` are considered."""
+        cutoff = self._cutoff(nrecs)
+        shared = {}
+        for token in tokens:
+            ids = postings(token)
+            freq = len(ids)
+            if freq == 0 or freq > cutoff:
+                continue
+            weight = math.log(float(nrecs) / freq) if self.idf else 1
+            for recid in ids:
+                if before is not None and recid >= before:
+                    break  # IDs are in increasing order
+                shared[recid] = shared.get(recid, 0) + weight
+        return dict((recid, weight) for recid, weight in shared.iteritems()
+                    if weight >= self.overlap)
+
+    def pairs(self, other=None):
+        """Generate the pairs of records sharing enough tokens.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        empty = array('i')
+        if other is None or other is self:
+            records, nrecs = self.records, len(self.records)
+            postings = lambda token: self.get(token, empty)
+            for j, tokens in enumerate(self.tokens):
+                b = records[j]
+                for i in sorted(self._candidates(tokens, postings, nrecs, j)):
+                    a = records[i]
+                    yield (a, b) if a <= b else (b, a)
+        else:
+            nrecs = len(other.records)
+            postings = lambda token: other.get(token, empty)
+            for a, tokens in zip(self.records, self.tokens):
+                for i in sorted(self._candidates(tokens, postings, nrecs)):
+                    yield a, other.records[i]
+
+    def count(self, other=None):
+        """Return the number of candidate pairs, by generating them.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        return sum(1 for _ in self.pairs(other))
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of candidate pairs of records sharing
+        enough tokens. By default against itself, and optionally against
+        another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about token postings, prefixing with `name`.
+
+        >>> from dedupe import qgram
+        >>> idx = qgram.Index(qgram.getter(0), [('ab',), ('abc',)], maxfreq=1)
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("GramIdx")
+        name=IdxSize idx=GramIdx recs=2 tokens=5 max=2 avg=1.40 skipped=2
+        """
+        if self:
+            postings = sum(len(ids) for ids in self.itervalues())
+            largest = max(len(ids) for ids in self.itervalues())
+            cutoff = self._cutoff(len(self.records))
+            skipped = sum(1 for ids in self.itervalues() if len(ids) > cutoff)
+            LOG.info("name=IdxSize idx=%s recs=%s tokens=%s max=%s avg=%.2f "
+                     "skipped=%s", name, len(self.records), len(self),
+                     largest, float(postings) / len(self), skipped)
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
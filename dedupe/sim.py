@@ -1,14 +1,89 @@
 """Compare values, fields, and records for similarity"""
 
 import collections
+import heapq
+from itertools import chain
 import logging
+import multiprocessing
+import os
 
 from dedupe.dale import similarity as dale
+from dedupe.group import UnionFind
 from dedupe.levenshtein import similarity as levenshtein
 from dedupe.compat import OrderedDict as _OrderedDict
 
 LOG = logging.getLogger('dedupe.sim')
 
+# Similarity function and list of pairs for forked worker processes
+_TASK = None
+
+
+def _compare_range(bounds):
+    """Compare the pairs in the (start, stop) range of the task list in
+    a worker process, returning similarity vectors as plain tuples since
+    :class:`Record` similarity classes cannot be pickled."""
+    simfunc, pairs = _TASK
+    result = []
+    for a, b in pairs[bounds[0]:bounds[1]]:
+        value = simfunc(a, b)
+        result.append(tuple(value) if isinstance(value, tuple) else value)
+    return result
+
+
+def _distinct(records):
+    """List of the distinct records, and set of the records found as
+    several different but equal objects, such as duplicate input rows."""
+    objects, seen, result, repeated = set(), set(), [], set()
+    for record in records:
+        if id(record) in objects:
+            continue
+        objects.add(id(record))
+        if record in seen:
+            repeated.add(record)
+        else:
+            seen.add(record)
+            result.append(record)
+    return result, repeated
+
+
+def total(similarity):
+    """Sum of the values in a similarity vector, counting missing values as
+    0.0, for ranking compared pairs when there is no classifier.
+
+    >>> from dedupe import sim
+    >>> sim.total((0.5, None, 0.25))
+    0.75
+    >>> sim.total(0.5)
+    0.5
+    """
+    if similarity is None:
+        return 0.0
+    if isinstance(similarity, (int, float)):
+        return float(similarity)
+    return float(sum(value for value in similarity if value is not None))
+
+
+def rank(scored, k=None, score=None):
+    """Sort (record, similarity) pairs from most to least similar.
+
+    :type scored: [(`R`, [`float`, ...]), ...]
+    :param scored: Records and their similarity vectors.
+    :type k: :class:`int` or :keyword:`None`
+    :param k: Keep only the `k` most similar.
+    :type score: function([`float`, ...]) `float`
+    :param score: Ranks the similarity vectors, by default :func:`total`.
+
+    >>> from dedupe import sim
+    >>> sim.rank([('A', (0.5, 0.2)), ('B', (0.9, None)), ('C', (0.1,))], 2)
+    [('B', (0.9, None)), ('A', (0.5, 0.2))]
+    """
+    if score is None:
+        score = total
+    key = lambda item: score(item[1])
+    if k is None:
+        return sorted(scored, key=key, reverse=True)
+    return heapq.nlargest(k, scored, key=key)
+
 
 class Convert(object):
     """Gets a single-valued field and converts it to a comparable value.
@@ -311,6 +386,10 @@ class Indices(_OrderedDict):
     :type records: [ `tuple`, ... ]
     :param records: List of records to insert into the indeces.
 
+    When all the index types are :class:`~block.CompactIndex` types, the
+    indices share one :class:`~block.RecordTable`, and generate each pair
+    in the order of the record IDs.
+
     >>> from dedupe import block, sim
     >>> makekey = lambda r: [int(r[1])]
     >>> makekey(('A', 3.5))
@@ -328,13 +407,26 @@ class Indices(_OrderedDict):
     Traceback (most recent call last):
         ...
     TypeError: []: not a strategy triple.
+    >>> compact = [("Int", block.CompactIndex, makekey),
+    ...            ("Name", block.CompactIndex, lambda r: [r[0]])]
+    >>> indices = sim.Indices(compact, records1)
+    >>> indices["Int"].records is indices["Name"].records
+    True
     """
 
     def __init__(self, strategy, records=[]):
+        from dedupe.block import CompactIndex, MappedIndex, RecordTable
         for strat in strategy:
             self.check_strategy(strat)
+        options = {}
+        bases = [getattr(idxtype, "func", idxtype)
+                 for _, idxtype, _ in strategy]
+        if bases and all(isinstance(base, type) and
+                         issubclass(base, CompactIndex) and
+                         not issubclass(base, MappedIndex) for base in bases):
+            options["table"] = RecordTable()
         super(Indices, self).__init__(
-            (name, idxtype(keyfunc, records))
+            (name, idxtype(keyfunc, records, **options))
             for name, idxtype, keyfunc in strategy)
 
     @staticmethod
@@ -350,12 +442,382 @@ class Indices(_OrderedDict):
         if not callable(keyfunc):
             raise TypeError("{0!r}: not callable.".format(keyfunc))
 
+    @property
+    def records(self):
+        """Record table of the first index that has one, such as a
+        :class:`~block.CompactIndex` or :class:`~block.MappedIndex`."""
+        for index in self.itervalues():
+            if hasattr(index, "records"):
+                return index.records
+        raise AttributeError("no index has a record table")
+
+    def save(self, outdir, prefix):
+        """Save each index to a binary file :file:`{outdir}/{prefix}{name}.idx`
+        for re-opening with :meth:`load`."""
+        for name, index in self.iteritems():
+            index.save(os.path.join(outdir, prefix + name + '.idx'))
+
+    @classmethod
+    def load(cls, strategy, outdir, prefix):
+        """Open indices saved with :meth:`save` as read-only memory-mapped
+        :class:`~block.MappedIndex` instances, or those that the `load`\
+        method of the index type opens (see :meth:`~block.Index.load`).
+
+        :type strategy: [ (`str`, `type`, `function`), ... ]
+        :param strategy: Strategy used to build the saved indices. Keyword\
+        arguments of :func:`functools.partial` index types, such as the\
+        `subkey`, are passed on to the mapped indices.
+
+        >>> import tempfile
+        >>> from dedupe import block, sim
+        >>> strategy = [("MyIndex", block.CompactIndex, lambda r: [r[0]])]
+        >>> outdir = tempfile.mkdtemp()
+        >>> sim.Indices(strategy, [('A', 1), ('B', 2)]).save(outdir, "m-")
+        >>> master = sim.Indices.load(strategy, outdir, "m-")
+        >>> master
+        Indices([('MyIndex', MappedIndex({'A': [('A', 1)], 'B': [('B', 2)]}))])
+        >>> list(master.records)
+        [('A', 1), ('B', 2)]
+        >>> sim.Indices(strategy, [('A', 3)]).compare(
+        ...     lambda a, b: 1.0, master)
+        {(('A', 3), ('A', 1)): 1.0}
+
+        A saved index keeps its keys hashed, whatever the strategy:
+
+        >>> from functools import partial
+        >>> hashed = [("MyIndex", partial(block.CompactIndex, hashkeys=True),
+        ...            lambda r: [r[0]])]
+        >>> sim.Indices(hashed, [('A', 1)]).save(outdir, "h-")
+        >>> sim.Indices(strategy, [('A', 3)]).compare(
+        ...     lambda a, b: 1.0, sim.Indices.load(strategy, outdir, "h-"))
+        Traceback (most recent call last):
+            ...
+        ValueError: hashkeys: False != True
+        """
+        from dedupe.block import MappedIndex
+        for strat in strategy:
+            cls.check_strategy(strat)
+        indices = cls([])
+        for name, idxtype, keyfunc in strategy:
+            options = getattr(idxtype, "keywords", None) or {}
+            load = getattr(getattr(idxtype, "func", idxtype), "load",
+                           MappedIndex)
+            indices[name] = load(
+                keyfunc, os.path.join(outdir, prefix + name + '.idx'),
+                **options)
+        return indices
+
     def insert(self, record):
         """Insert a record into each :class:`Index`."""
         for index in self.itervalues():
             index.insert(record)
 
-    def compare(self, simfunc, other=None):
+    def _zip(self, other):
+        """Pair up the indices of `self` and `other`, checking that each
+        pair of indices can be compared."""
+        for index1, index2 in zip(self.itervalues(), other.itervalues()):
+            if not (isinstance(index1, type(index2)) or
+                    isinstance(index2, type(index1))):
+                raise TypeError(
+                    "Indeces of type {0} and type {1} are incompatible"\
+                    .format(type(index1), type(index2)))
+            hashkeys1 = getattr(index1, "hashkeys", False)
+            hashkeys2 = getattr(index2, "hashkeys", False)
+            if hashkeys1 != hashkeys2:
+                raise ValueError("hashkeys: {0} != {1}".format(
+                    hashkeys1, hashkeys2))
+            yield index1, index2
+
+    def link(self, record, simfunc, other=None):
+        """Insert a record into each index, and compute its similarity to
+        the previously indexed records sharing an index key, for linking
+        records one at a time as they arrive. The index types must support
+        the `link` method.
+
+        :type record: `R`
+        :param record: The new record.
+
+        :type simfunc: func(`R`, `R`) (`float`, ...)
+        :param simfunc: takes pair of records and returns a similarity vector.
+
+        :type other: :class:`Indices`
+        :param other: Compare the record against these indices instead.
+
+        :rtype: {(R, R):(float, ...)}
+        :return: mapping from pairs of the new record and a previously\
+        indexed record to similarity vectors, each pair compared once\
+        even when it is found in several indices.
+
+        >>> from dedupe import block, sim
+        >>> makekey = lambda r: [int(r[1])]
+        >>> compare = lambda x, y: 2**-abs(float(x[1])-float(y[1]))
+        >>> strategy = [("MyIndex", block.Index, makekey),
+        ...             ("Tens", block.Index, lambda r: [int(r[1] / 10)])]
+        >>> indices = sim.Indices(strategy, [('A', 5.5), ('B', 4.5)])
+        >>> indices.link(('C', 5.0), compare)  #doctest: +NORMALIZE_WHITESPACE
+        {(('A', 5.5), ('C', 5.0)): 0.7071067811865476,
+         (('B', 4.5), ('C', 5.0)): 0.7071067811865476}
+        """
+        comparisons = {}
+        if other is None or other is self:
+            pairs = ((index, None) for index in self.itervalues())
+        else:
+            pairs = self._zip(other)
+        for index1, index2 in pairs:
+            if not hasattr(index1, "link"):
+                raise TypeError("{0!r}: does not support link.".format(
+                    type(index1)))
+            for pair in index1.link(record, index2):
+                if pair not in comparisons:
+                    comparisons[pair] = simfunc(pair[0], pair[1])
+        return comparisons
+
+    def lookup(self, probes, simfunc=None, k=None, score=None):
+        """Find the indexed records sharing a key with each of several probe
+        records in any of the indices, for low-latency queries against
+        master indices. The index types must support the `lookup` method.
+
+        :type probes: [`R1`, ...]
+        :param probes: Records to look up.
+        :type simfunc: func(`R1`, `R2`) (`float`, ...) or :keyword:`None`
+        :param simfunc: Optionally compare each probe with its candidates.
+        :type k: :class:`int` or :keyword:`None`
+        :param k: With `simfunc`, keep only the `k` best candidates.
+        :type score: function([`float`, ...]) `float`
+        :param score: Ranks the similarity vectors, by default :func:`total`.
+        :rtype: [[`R2`, ...], ...] or [[(`R2`, (`float`, ...)), ...], ...]
+        :return: For each probe, the distinct candidate records in index\
+        order, or with `simfunc` the (candidate, similarity) pairs from best\
+        to worst.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> master = sim.Indices(strategy, [('A', 5.5), ('B', 4.5)])
+        >>> master.lookup([('A', 4.2), ('C', 1.0)])
+        [[('B', 4.5), ('A', 5.5)], []]
+        >>> compare = sim.Record(
+        ...     ("V", sim.Field(lambda a, b: 1 - abs(a - b), 1)))
+        >>> master.lookup([('A', 4.0)], compare, k=1)
+        [[(('B', 4.5), Similarity(V=0.5))]]
+        """
+        found = [[] for _ in probes]
+        seen = [set() for _ in probes]
+        for index in self.itervalues():
+            if not hasattr(index, "lookup"):
+                raise TypeError("{0!r}: does not support lookup.".format(
+                    type(index)))
+            for pos, records in enumerate(index.lookup(probes)):
+                for record in records:
+                    if record not in seen[pos]:
+                        seen[pos].add(record)
+                        found[pos].append(record)
+        if simfunc is None:
+            return found
+        return [rank([(record, simfunc(probe, record)) for record in records],
+                     k, score) for probe, records in zip(probes, found)]
+
+    def pairs(self, other=None):
+        """Generate the distinct pairs of records that :meth:`compare`
+        would compare, in the same order. The index types must support the
+        `pairs` method.
+
+        :type other: :class:`Indices`
+        :param other: Another Indices to pair records with.
+
+        :rtype: iter [(R, R), ...]
+        :return: each candidate pair once, even when found in several indices.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> indices = sim.Indices(strategy, [('A', 5.5), ('A', 5.2)])
+        >>> list(indices.pairs())
+        [(('A', 5.2), ('A', 5.5))]
+        """
+        if other is None or other is self:
+            pairs = ((index, None) for index in self.itervalues())
+        else:
+            pairs = self._zip(other)
+        seen = set()
+        for index1, index2 in pairs:
+            if not hasattr(index1, "pairs"):
+                raise TypeError("{0!r}: does not support pairs.".format(
+                    type(index1)))
+            for pair in index1.pairs(index2):
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair
+
+    def owned_pairs(self, other=None, names=None):
+        """Generate each distinct candidate pair once, like :meth:`pairs`,
+        but without remembering the pairs already generated. A pair is owned
+        by the first index that pairs the records, and in that index by the
+        least key the records share, which is decided for each block by
+        recomputing the keys of its records. The blocks can therefore be
+        processed separately, and memory does not grow with the number of
+        pairs. The index types must be :class:`~block.Index` types that do
+        not split blocks on sub-keys.
+
+        :type other: :class:`Indices`
+        :param other: Another Indices to pair records with.
+        :type names: [`str`, ...] or :keyword:`None`
+        :param names: Generate only the pairs owned by the indices having\
+        these names, for processing the indices separately.
+        :rtype: iter [(R, R), ...]
+        :return: each candidate pair once, ordered as by the index.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0], r[0][:1]])]
+        >>> records = [('AB', 5.5), ('AB', 5.2), ('AC', 4.5), ('B', 4.9)]
+        >>> indices = sim.Indices(strategy, records)
+        >>> sorted(indices.owned_pairs())
+        [(('AB', 5.2), ('AB', 5.5)), (('AB', 5.2), ('AC', 4.5)),\
+ (('AB', 5.5), ('AC', 4.5)), (('AC', 4.5), ('B', 4.9))]
+        >>> list(indices.owned_pairs(names=["Name"]))
+        [(('AB', 5.2), ('AC', 4.5)), (('AB', 5.5), ('AC', 4.5))]
+
+        The same holds for :class:`~block.CompactIndex` indices, which
+        store a row repeated in the input once:
+
+        >>> compact = [(name, block.CompactIndex, makekey)
+        ...            for name, _, makekey in strategy]
+        >>> indices = sim.Indices(compact, records + [('AB', 5.5)])
+        >>> owned = list(indices.owned_pairs())
+        >>> len(owned), set(owned) == set(indices.pairs())
+        (4, True)
+        >>> set(owned) == set(indices.compare(lambda a, b: 1.0))
+        True
+        """
+        single = other is None or other is self
+        if single:
+            zipped = [(index, index) for index in self.itervalues()]
+        else:
+            zipped = list(self._zip(other))
+        for index1, index2 in zipped:
+            for index in (index1, index2):
+                if getattr(index, "storedkeys", None) is None:
+                    raise TypeError(
+                        "{0!r}: does not support owned pairs.".format(
+                            type(index)))
+                if index.subkeys and index.maxblock is not None:
+                    raise ValueError("owned pairs: blocks split on sub-keys")
+                index.purge()
+        for pos, (name, (index1, index2)) in enumerate(
+            zip(self.iterkeys(), zipped)):
+            if names is not None and name not in names:
+                continue
+            if single:
+                blocks = ((key, records, None)
+                          for key, records in index1.itergroups())
+            else:
+                blocks = index1.join(index2)
+            for key, records1, records2 in blocks:
+                cache1, cache2 = {}, {}
+                # a record having the same key twice is in the block twice,
+                # and equal records form the same pair
+                records1, repeated = _distinct(index1._ordered(records1))
+                if single:
+                    pairs = chain(
+                        ((record, record) for record in sorted(repeated)),
+                        ((records1[i], records1[j])
+                         for j in xrange(len(records1)) for i in xrange(j)))
+                    cache2 = cache1
+                else:
+                    records2 = _distinct(records2)[0]
+                    pairs = ((rec1, rec2) for rec1 in records1
+                             for rec2 in records2)
+                for pair in pairs:
+                    if self._owns(zipped, pos, key, pair, cache1, cache2):
+                        yield pair
+
+    @staticmethod
+    def _owns(zipped, pos, key, pair, cache1, cache2):
+        """Whether the pair found under `key` of the index at `pos` of
+        `zipped` is not paired by an earlier index, nor under a lesser key.
+        The stored keys of the records are cached by record for the block.
+        """
+        rec1, rec2 = pair
+        keys1 = cache1.get(id(rec1))
+        if keys1 is None:
+            keys1 = cache1[id(rec1)] = [
+                index1.storedkeys(rec1) for index1, _ in zipped[:pos + 1]]
+        keys2 = cache2.get(id(rec2))
+        if keys2 is None:
+            keys2 = cache2[id(rec2)] = [
+                index2.storedkeys(rec2) for _, index2 in zipped[:pos + 1]]
+        for (index1, index2), k1, k2 in zip(zipped, keys1, keys2)[:pos]:
+            if any(k in index1 and k in index2 for k in k1 & k2):
+                return False
+        index1, index2 = zipped[pos]
+        return key == min(k for k in keys1[pos] & keys2[pos]
+                          if k in index1 and k in index2)
+
+    def itercompare(self, simfunc, other=None, names=None):
+        """Compute the similarities of the candidate pairs one at a time,
+        comparing each pair once without keeping the comparisons, for
+        streaming them out (see :meth:`owned_pairs`).
+
+        :rtype: iter [((R, R), (float, ...)), ...]
+        :return: each pair of records with its similarity vector.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> records = [('A', 5.5), ('B', 5.2), ('A', 4.5), ('C', 5.0)]
+        >>> indices = sim.Indices(strategy, records)
+        >>> compare = lambda a, b: abs(a[1] - b[1])
+        >>> dict(indices.itercompare(compare)) == indices.compare(compare)
+        True
+        """
+        for pair in self.owned_pairs(other, names):
+            yield pair, simfunc(pair[0], pair[1])
+
+    def dry_run(self, other=None):
+        """Count the exact number of distinct pairs that :meth:`compare`
+        would evaluate, without calling any similarity function, and log
+        the counts. The index types must support the `pairs` method.
+
+        :type other: :class:`Indices`
+        :param other: Another Indices to pair records with.
+
+        :rtype: {`str`: (`int`, `int`)}
+        :return: For each index name, the number of distinct pairs in the\
+        index, and the number of those not already found by the earlier\
+        indices. The sum of the latter is the total number of comparisons.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> records = [('A', 5.5), ('B', 5.2), ('A', 4.5), ('A', 5.0)]
+        >>> sim.Indices(strategy, records).dry_run()
+        OrderedDict([('Int', (3, 3)), ('Name', (3, 2))])
+        """
+        if other is None or other is self:
+            pairs = ((name, index, None) for name, index in self.iteritems())
+        else:
+            pairs = ((name, index1, index2) for name, (index1, index2)
+                     in zip(self.iterkeys(), self._zip(other)))
+        counts = _OrderedDict()
+        seen = set()
+        for name, index1, index2 in pairs:
+            if not hasattr(index1, "pairs"):
+                raise TypeError("{0!r}: does not support pairs.".format(
+                    type(index1)))
+            distinct = set(index1.pairs(index2))
+            before = len(seen)
+            seen.update(distinct)
+            counts[name] = (len(distinct), len(seen) - before)
+            LOG.info("name=DryRun idx=%s pairs=%s new=%s",
+                     name, len(distinct), len(seen) - before)
+        LOG.info("name=DryRunTotal comparisons=%s overlap=%s", len(seen),
+                 sum(n for n, _ in counts.itervalues()) - len(seen))
+        return counts
+
+    def compare(self, simfunc, other=None, processes=None, chunksize=None,
+                prune=None, k=None, score=None, confident=None, audit=False,
+                budget=None):
         """Compute similarities of indexed pairs of records.
 
         :type simfunc: func(`R`, `R`) (`float`, ...)
@@ -364,28 +826,266 @@ class Indices(_OrderedDict):
         :type other: :class:`Indices`
         :param other: Another Indices to compare against.
 
+        :type processes: :class:`int` or :keyword:`None`
+        :param processes: Compare pairs in a pool of this many worker\
+        processes, with the same result as comparing in this process.\
+        The workers are forked with a copy of `simfunc` and the candidate\
+        pairs, so this requires a platform with :func:`os.fork`.  The `k`,\
+        `confident` and `budget` stages compare in this process, so they\
+        cannot be combined with more than one process.
+
+        :type chunksize: :class:`int` or :keyword:`None`
+        :param chunksize: Number of pairs sent to a worker at a time.
+
+        :type prune: function(:class:`Indices`, :class:`Indices`) [(R, R)]
+        :param prune: Meta-blocking stage selecting the distinct candidate\
+        pairs to compare, such as a :class:`~metablock.Pruner`.
+
+        :type k: :class:`int` or :keyword:`None`
+        :param k: Keep only the `k` best compared pairs of each record (of\
+        each record of `self` when comparing against `other`), see\
+        :meth:`_compare_topk`.
+
+        :type score: function([`float`, ...]) `float`
+        :param score: Ranks the similarity vectors for `k`, by default\
+        :func:`total`.
+
+        :type confident: function([`float`, ...]) `bool`
+        :param confident: Merge the pairs whose similarity vectors pass this\
+        test into clusters while comparing, and skip pairs of records already\
+        in the same cluster, see :meth:`_compare_transitive`.
+
+        :type audit: :class:`bool`
+        :param audit: With `confident`, compare the pairs in the same\
+        cluster anyway and log how many are not confident matches.
+
+        :type budget: :class:`~progressive.Budget` or :keyword:`None`
+        :param budget: Compare the likely matches first and stop when the\
+        budget runs out, see :meth:`_compare_progressive`.
+
         :rtype: {(R, R):(float, ...)}
         :return: mapping from pairs of records similarity vectors.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> records = [('A', 5.5), ('B', 5.2), ('A', 4.5), ('C', 5.0)]
+        >>> indices = sim.Indices(strategy, records)
+        >>> compare = sim.Record(("V", sim.Field(lambda a, b: a - b, 1)))
+        >>> parallel = indices.compare(compare, processes=2, chunksize=2)
+        >>> parallel == indices.compare(compare)
+        True
+        >>> parallel[(('A', 4.5), ('A', 5.5))]
+        Similarity(V=-1.0)
+        >>> indices.compare(compare, processes=2, k=1)
+        Traceback (most recent call last):
+            ...
+        ValueError: processes cannot be combined with k, confident or budget
         """
+        if k is not None and confident is not None:
+            raise ValueError("k and confident cannot be combined")
+        parallel = processes is not None and processes > 1
+        if parallel and (k is not None or confident is not None or
+                         budget is not None):
+            raise ValueError("processes cannot be combined with k, "
+                             "confident or budget")
+        if budget is not None:
+            if k is not None or confident is not None or prune is not None:
+                raise ValueError("budget cannot be combined with k, "
+                                 "confident or prune")
+            return self._compare_progressive(simfunc, other, budget)
+        if k is not None:
+            return self._compare_topk(simfunc, other, prune, k, score)
+        if confident is not None:
+            return self._compare_transitive(
+                simfunc, other, prune, confident, audit)
+        if prune is not None or parallel:
+            if prune is not None:
+                pairs = list(prune(self, other))
+            else:
+                pairs = list(self.pairs(other))
+            if parallel:
+                return self._compare_parallel(
+                    simfunc, pairs, processes, chunksize)
+            return dict((pair, simfunc(pair[0], pair[1])) for pair in pairs)
         comparisons = {}
         if other is None or other is self:
             for index in self.itervalues():
                 index.compare(simfunc, None, comparisons)
         else:
-            for index1, index2 in zip(self.itervalues(), other.itervalues()):
-                if type(index1) is not type(index2):
-                    raise TypeError(
-                        "Indeces of type {0} and type {1} are incompatible"\
-                        .format(type(index1), type(index2)))
+            for index1, index2 in self._zip(other):
                 index1.compare(simfunc, index2, comparisons)
         return comparisons
 
+    def _compare_topk(self, simfunc, other, prune, k, score):
+        """Compare the candidate pairs, keeping a heap of the `k` best pairs
+        for each record, so that memory is bounded by `k` times the number
+        of records rather than by the number of candidate pairs.  The pairs
+        are not tracked once dropped from the heaps, so a pair found by
+        several indices may be compared more than once.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])]),
+        ...             ("Name", block.Index, lambda r: [r[0]])]
+        >>> master = sim.Indices(strategy, [('A', 5.5), ('B', 5.2),
+        ...                                 ('A', 4.5), ('C', 5.0)])
+        >>> indices = sim.Indices(strategy, [('A', 5.1), ('D', 4.9)])
+        >>> compare = lambda a, b: 1 - abs(a[1] - b[1])
+        >>> best = indices.compare(compare, master, k=1)
+        >>> sorted((a, b) for a, b in best)
+        [(('A', 5.1), ('C', 5.0)), (('D', 4.9), ('A', 4.5))]
+        >>> len(indices.compare(compare, master, k=2))
+        3
+        """
+        if score is None:
+            score = total
+        single = other is None or other is self
+        if prune is not None:
+            pairs = prune(self, other)
+        elif single:
+            pairs = (pair for index in self.itervalues()
+                     for pair in index.pairs(None))
+        else:
+            pairs = (pair for index1, index2 in self._zip(other)
+                     for pair in index1.pairs(index2))
+        heaps = {}
+        seq = 0
+        for pair in pairs:
+            owners = pair if single else pair[:1]
+            if any(entry[2] == pair for owner in owners
+                   for entry in heaps.get(owner, ())):
+                continue  # already among the best for a record
+            value = simfunc(pair[0], pair[1])
+            seq += 1
+            # earlier pairs win ties, and the pairs are never compared
+            entry = (score(value), -seq, pair, value)
+            for owner in owners:
+                heap = heaps.setdefault(owner, [])
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heappushpop(heap, entry)
+        return dict((entry[2], entry[3]) for heap in heaps.itervalues()
+                    for entry in heap)
+
+    def _compare_transitive(self, simfunc, other, prune, confident, audit):
+        """Compare the distinct candidate pairs, merging the records of
+        confident matches into clusters, and skipping pairs of records
+        already in the same cluster, which are implied matches.  Skipped
+        pairs are absent from the result, but the records are still grouped
+        by :func:`~group.components` through the pairs that were compared.
+
+        >>> from dedupe import block, sim
+        >>> strategy = [("Name", block.Index, lambda r: [r[0]])]
+        >>> records = [('A', 1.0), ('A', 1.05), ('A', 1.1), ('B', 2.0)]
+        >>> indices = sim.Indices(strategy, records)
+        >>> compare = lambda a, b: 1 - abs(a[1] - b[1])
+        >>> result = indices.compare(compare, confident=lambda v: v > 0.85)
+        >>> sorted(result)
+        [(('A', 1.0), ('A', 1.05)), (('A', 1.0), ('A', 1.1))]
+        >>> len(indices.compare(compare, confident=lambda v: v > 0.85,
+        ...                     audit=True))
+        3
+        """
+        single = other is None or other is self
+        pairs = prune(self, other) if prune is not None else self.pairs(other)
+        clusters = UnionFind()
+        comparisons = {}
+        skipped, implied, unconfirmed = 0, 0, 0
+        for pair in pairs:
+            # records of two indices are distinct even when equal
+            node1, node2 = pair if single else ((0, pair[0]), (1, pair[1]))
+            same = clusters.find(node1) == clusters.find(node2)
+            if same and not audit:
+                skipped += 1
+                continue
+            value = simfunc(pair[0], pair[1])
+            comparisons[pair] = value
+            if same:
+                implied += 1
+                if not confident(value):
+                    unconfirmed += 1
+            elif confident(value):
+                clusters.union(node1, node2)
+        LOG.info("name=Transitivity compared=%s skipped=%s",
+                 len(comparisons), skipped)
+        if audit:
+            LOG.info("name=TransitivityAudit implied=%s unconfirmed=%s",
+                     implied, unconfirmed)
+        return comparisons
+
+    def _compare_progressive(self, simfunc, other, budget):
+        """Compare the distinct candidate pairs in the order of the
+        `budget` schedule until the budget is exhausted, leaving the pairs
+        not compared in the `unexplored` attribute of the budget.
+
+        >>> from dedupe import block, progressive, sim
+        >>> strategy = [("Int", block.Index, lambda r: [int(r[1])])]
+        >>> records = [('A', 5.5), ('B', 5.2), ('C', 6.0), ('D', 6.1),
+        ...            ('E', 6.2)]
+        >>> indices = sim.Indices(strategy, records)
+        >>> compare = lambda a, b: 1 - abs(a[1] - b[1])
+        >>> budget = progressive.Budget(seconds=0)
+        >>> indices.compare(compare, budget=budget)
+        {}
+        >>> len(budget.unexplored)
+        4
+        >>> budget = progressive.Budget(seconds=60, comparisons=1)
+        >>> indices.compare(compare, budget=budget).keys()
+        [(('A', 5.5), ('B', 5.2))]
+        >>> budget = progressive.Budget(seconds=60)
+        >>> len(indices.compare(compare, budget=budget)), budget.unexplored
+        (4, [])
+        """
+        budget.start()
+        pairs = budget.schedule(self, other)
+        comparisons = {}
+        for pair, _ in pairs:
+            if budget.exhausted(len(comparisons)):
+                break
+            comparisons[pair] = simfunc(pair[0], pair[1])
+        budget.unexplored = pairs[len(comparisons):]
+        budget.report(len(comparisons))
+        return comparisons
+
+    def _compare_parallel(self, simfunc, pairs, processes, chunksize):
+        """Compare the distinct candidate pairs in a process pool."""
+        global _TASK
+        if chunksize is None:
+            chunksize = len(pairs) // (processes * 4) + 1
+        bounds = [(start, min(start + chunksize, len(pairs)))
+                  for start in xrange(0, len(pairs), chunksize)]
+        _TASK = (simfunc, pairs)
+        try:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_compare_range, bounds, 1)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            _TASK = None
+        Similarity = getattr(simfunc, "Similarity", None)
+        comparisons = {}
+        for (start, stop), values in zip(bounds, results):
+            for pair, value in zip(pairs[start:stop], values):
+                if Similarity is not None and isinstance(value, tuple):
+                    value = Similarity._make(value)
+                comparisons[pair] = value
+        return comparisons
+
     def log_comparisons(self, other):
         """Log the expected between-index comparisons."""
         if other is not None and other is not self:
             for (n1, i1), (n2, i2) in zip(self.items(), other.items()):
                 LOG.info("name=TwoIndexCompare idx1=%s idx2=%s comparisons=%s",
                          n1, n2, i1.count(i2))
+                stats = getattr(i1, "joinstats", None)
+                if stats:
+                    LOG.info("name=JoinStats idx1=%s idx2=%s method=%s "
+                             "keys1=%s keys2=%s common=%s probes=%s", n1, n2,
+                             stats["method"], stats["keys1"], stats["keys2"],
+                             stats["common"], stats["probes"])
                 i1.log_size(n1)
                 i2.log_size(n2)
         else:
@@ -0,0 +1,275 @@
+"""Index pairing records whose keys share a suffix or a prefix
+
+Exact keys in :class:`~block.Index` break when a field has junk at one end,
+such as an account number with a branch code in front or a name with a
+trailing "ltd".  This index pairs records whose keys end with the same
+`minlen` or more characters (or begin with them, for `prefix`).
+
+Instead of emitting every suffix of every key into a dict, the keys are
+kept in one sorted list (reversed, for suffixes), in which the keys
+sharing any given suffix form a contiguous run.  A run matching more than
+`maxfreq` keys is too common to be useful, so it is split on the next
+character, and records sharing only that common suffix are not paired.
+"""
+
+import logging
+from operator import itemgetter
+
+LOG = logging.getLogger('dedupe.suffix')
+
+
+class Index(object):
+    """Sorted list of (key, record) entries, pairing records whose keys
+    share a suffix (or prefix) of at least `minlen` characters that is
+    found in no more than `maxfreq` entries.
+
+    To change the parameters in an index strategy, use
+    :func:`functools.partial` to create the index type.
+
+    :type makekey: function(`R`) [:class:`unicode`, ...]
+    :param makekey: Generates the index keys for the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type minlen: :class:`int`
+    :param minlen: Minimum length of a shared suffix.
+    :type maxfreq: :class:`int` or :class:`float` or :keyword:`None`
+    :param maxfreq: Skip suffixes found in more entries than this. Values\
+    below 1.0 are a fraction of the number of entries.
+    :type prefix: :class:`bool`
+    :param prefix: Pair records sharing a prefix instead of a suffix.
+
+    >>> from dedupe import suffix
+    >>> makekey = lambda r: [r[1]]
+    >>> compare = lambda x, y: float(x[1] == y[1])
+    >>> records = [('A', 'X-10442'), ('B', '10442'), ('C', '99442'),
+    ...            ('D', '20442'), ('E', '30442')]
+    >>> idx = suffix.Index(makekey, records, minlen=3)
+    >>> idx.count()
+    10
+    >>> idx = suffix.Index(makekey, records, minlen=3, maxfreq=2)
+    >>> idx.compare(compare)
+    {(('A', 'X-10442'), ('B', '10442')): 0.0}
+    >>> other = suffix.Index(makekey, [('F', '1-20442')], minlen=3, maxfreq=2)
+    >>> idx.compare(compare, other)
+    {(('D', '20442'), ('F', '1-20442')): 0.0}
+    >>> pidx = suffix.Index(makekey, records, minlen=3, prefix=True)
+    >>> list(pidx.pairs())
+    []
+    """
+
+    def __init__(self, makekey, records=None, minlen=3, maxfreq=None,
+                 prefix=False):
+        if minlen < 1:
+            raise ValueError("minlen: {0} is less than 1".format(minlen))
+        self.makekey = makekey
+        self.minlen = minlen
+        self.maxfreq = maxfreq
+        self.prefix = prefix
+        self.entries = []
+        self.sorted = True
+        if records:
+            for record in records:
+                self.insert(record)
+
+    def _stored(self, key):
+        """Key as stored in the entries: reversed unless in prefix mode,
+        so that shared suffixes become shared prefixes."""
+        return key if self.prefix else key[::-1]
+
+    def insert(self, record):
+        """Insert a record into the index.
+
+        :type record: :class:`namedtuple` or other record.
+        :param record: The record object to index.
+        :rtype: [:class:`unicode`, ...]
+        :return: Keys under which the record was inserted.
+        """
+        keys = self.makekey(record)
+        for key in keys:
+            if key is None or key == "":
+                raise ValueError("Empty index key in %s for record %s" % (
+                    repr(keys), repr(record)))
+            self.entries.append((self._stored(key), record))
+        self.sorted = False
+        return keys
+
+    def sort(self):
+        """Sort the entries on the stored key."""
+        if not self.sorted:
+            self.entries.sort(key=itemgetter(0))
+            self.sorted = True
+
+    def _cutoff(self, nentries):
+        """Maximum number of entries sharing a usable suffix."""
+        if self.maxfreq is None:
+            return nentries
+        elif self.maxfreq < 1.0:
+            return self.maxfreq * nentries
+        return self.maxfreq
+
+    def _merged(self, other):
+        """Sorted (key, record, side) entries of both indices, where side is
+        0 for entries from `self` and 1 for entries from `other`."""
+        self.sort()
+        other.sort()
+        entries = [(k, r, 0) for k, r in self.entries]
+        entries.extend((k, r, 1) for k, r in other.entries)
+        entries.sort(key=itemgetter(0))
+        return entries
+
+    def _runs(self, entries, fits, useful):
+        """Generate (lo, hi, depth) for the runs of `entries` sharing their
+        first `depth` >= `minlen` characters, where `fits` accepts the run.
+        Runs rejected by `fits` are split on the next character, and runs
+        rejected by `useful` are dropped."""
+        minlen, nents = self.minlen, len(entries)
+        stack, lo = [], 0
+        while lo < nents:
+            stem = entries[lo][0][:minlen]
+            hi = lo + 1
+            while hi < nents and entries[hi][0][:minlen] == stem:
+                hi += 1
+            if len(stem) == minlen and useful(lo, hi):
+                stack.append((lo, hi, minlen))
+            lo = hi
+        stack.reverse()
+        while stack:
+            lo, hi, depth = stack.pop()
+            if fits(lo, hi):
+                yield lo, hi, depth
+                continue
+            split = []
+            while lo < hi:
+                char = entries[lo][0][depth:depth + 1]
+                end = lo + 1
+                while end < hi and entries[end][0][depth:depth + 1] == char:
+                    end += 1
+                if char and useful(lo, end):
+                    split.append((lo, end, depth + 1))
+                lo = end
+            stack.extend(reversed(split))
+
+    def _blocks(self, other=None):
+        """Generate (entries, lo, hi, depth) for each run of entries to
+        pair, where for two indices the entries are from :meth:`_merged`."""
+        if other is None or other is self:
+            self.sort()
+            entries = self.entries
+            cutoff = self._cutoff(len(entries))
+            fits = lambda lo, hi: hi - lo <= cutoff
+            useful = lambda lo, hi: hi - lo > 1
+        else:
+            entries = self._merged(other)
+            sides = [0]
+            for entry in entries:
+                sides.append(sides[-1] + entry[2])  # running count of side 1
+            cutoff1 = self._cutoff(len(self.entries))
+            cutoff2 = other._cutoff(len(other.entries))
+            fits = lambda lo, hi: (
+                (hi - lo) - (sides[hi] - sides[lo]) <= cutoff1 and
+                sides[hi] - sides[lo] <= cutoff2)
+            useful = lambda lo, hi: 0 < sides[hi] - sides[lo] < hi - lo
+        for lo, hi, depth in self._runs(entries, fits, useful):
+            yield entries, lo, hi, depth
+
+    def records_for(self, key):
+        """List of the records having a key with suffix (or prefix) `key`.
+        """
+        self.sort()
+        stem = self._stored(key)
+        return [rec for k, rec in self.entries if k.startswith(stem)]
+
+    def itergroups(self):
+        """Iterate over (suffix, records) for each run of records that
+        are paired with each other."""
+        for entries, lo, hi, depth in self._blocks():
+            yield (self._stored(entries[lo][0][:depth]),
+                   [entries[i][1] for i in xrange(lo, hi)])
+
+    def pairs(self, other=None):
+        """Generate the pairs of records sharing a suffix. A pair may be
+        generated more than once when the records have several keys.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        selfpairs = other is None or other is self
+        for entries, lo, hi, depth in self._blocks(other):
+            for j in xrange(lo + 1, hi):
+                b = entries[j][1]
+                for i in xrange(lo, j):
+                    a = entries[i][1]
+                    if selfpairs:
+                        if a is not b:
+                            yield (a, b) if a <= b else (b, a)
+                    elif entries[i][2] < entries[j][2]:
+                        yield a, b
+                    elif entries[i][2] > entries[j][2]:
+                        yield b, a
+
+    def count(self, other=None):
+        """Return upper bound on the number of comparisons required by this
+        index. The actual number of comparison function calls will be lower
+        due to caching of comparisons.
+
+        :type: other: :class:`Index` or :keyword:`None`
+        :param other: Count comparisons against this index.
+        """
+        comparisons = 0
+        for entries, lo, hi, depth in self._blocks(other):
+            if other is None or other is self:
+                comparisons += (hi - lo) * (hi - lo - 1) // 2
+            else:
+                right = sum(entries[i][2] for i in xrange(lo, hi))
+                comparisons += (hi - lo - right) * right
+        return comparisons
+
+    def compare(self, compare, other=None, comparisons=None):
+        """Perform comparisons of records sharing a suffix. By default
+        against itself, and optionally against another index.
+
+        :type compare: function(`R1`, `R2`) [`float`, ...]
+        :param compare: Function for comparing a pair of records.
+
+        :type other: :class:`Index`
+        :param other: Optional second index to compare against.
+
+        :type comparisons: {(`R1`, `R2`):[`float`, ...]}
+        :param comparisons: Dict mapping pairs of records to comparisons. For
+        single-index we must have `R1` < `R2`, while with two indeces `R1` is
+        from `self` while `R2` is from `other`.
+
+        :return: Updated comparisons dict.
+        """
+        if comparisons is None:
+            comparisons = {}
+        for pair in self.pairs(other):
+            if pair not in comparisons:
+                comparisons[pair] = compare(pair[0], pair[1])
+        return comparisons
+
+    def log_size(self, name):
+        """Log statistics about the runs of paired entries, prefixing with
+        `name`. Entries in no run either have no suffix in common with
+        another key, or only suffixes found in more than `maxfreq` entries.
+
+        >>> from dedupe import suffix
+        >>> makekey = lambda r: [r[0]]
+        >>> idx = suffix.Index(makekey, [('x123',), ('y123',), ('z999',)])
+        >>> def log(s, *a):
+        ...     print s % a
+        >>> LOG.info = log
+        >>> idx.log_size("SuffixIdx")
+        name=IdxSize idx=SuffixIdx entries=3 runs=1 max=2 unpaired=1
+        """
+        if self.entries:
+            sizes = [hi - lo for _, lo, hi, _ in self._blocks()]
+            LOG.info("name=IdxSize idx=%s entries=%s runs=%s max=%s "
+                     "unpaired=%s", name, len(self.entries), len(sizes),
+                     max(sizes) if sizes else 0,
+                     len(self.entries) - sum(sizes))
+        else:
+            LOG.info("name=EmptyIndex idx=%s", name)
@@ -0,0 +1,207 @@
+"""Symmetric-deletion index for blocking on keys with typing errors
+
+Two strings within edit distance `d` of each other have a string in
+common after deleting at most `d` characters from each (Garbe's SymSpell).
+This index inserts each record under every deletion variant of its keys, so
+that the records with nearby keys collide in the blocks of the dictionary
+without any pairwise scan of the keys, and then checks the actual
+:func:`~levenshtein.distance` of the keys of each candidate pair.  Unlike
+a phonetic key, this finds every pair of keys within the distance: keys
+of at most `d` characters share the empty string as a variant.
+"""
+
+import logging
+
+from dedupe import block
+from dedupe.levenshtein import distance as levenshtein
+from dedupe.sim import rank
+
+LOG = logging.getLogger('dedupe.symdel')
+
+
+def deletions(key, distance=1):
+    """List the strings made by deleting at most `distance` characters
+    from `key`, including `key` itself, and the empty string when `key`
+    has at most `distance` characters.
+
+    :type key: :class:`str` or :class:`unicode`
+    :param key: String to delete characters from.
+    :type distance: :class:`int`
+    :param distance: Largest number of characters to delete.
+    :rtype: [:class:`str`, ...]
+    :return: Sorted distinct variants of `key`.
+
+    >>> from dedupe import symdel
+    >>> symdel.deletions('SMITH')
+    ['MITH', 'SITH', 'SMIH', 'SMIT', 'SMITH', 'SMTH']
+    >>> len(symdel.deletions('SMITH', 2))
+    16
+    >>> symdel.deletions('AB', 2)
+    ['', 'A', 'AB', 'B']
+    """
+    variants = set([key])
+    frontier = variants
+    for _ in xrange(distance):
+        frontier = set(variant[:pos] + variant[pos + 1:]
+                       for variant in frontier
+                       for pos in xrange(len(variant))) - variants
+        variants.update(frontier)
+    return sorted(variants)
+
+
+class Index(block.Index):
+    """Block index under the deletion variants of the keys, pairing the
+    records having keys within edit distance `distance`.
+
+    To change the distance in an index strategy, use
+    :func:`functools.partial` to create the index type.  The other
+    parameters are the same as for :class:`~block.Index`, and apply to the
+    blocks of the variants: purging or splitting blocks loses pairs.  The
+    :meth:`~block.Index.count` is of the pairs sharing a block, before
+    checking the distance of their keys.
+
+    :type makekey: function(`R`) [:class:`str`, ...]
+    :param makekey: Generates the string keys for the record.
+    :type records: [`R`, ...]
+    :param records: Initial records to load into the index.
+    :type distance: :class:`int`
+    :param distance: Largest edit distance between keys of records to pair.
+
+    >>> from dedupe import symdel
+    >>> makekey = lambda r: [r[1]]
+    >>> compare = lambda x, y: x[1] == y[1]
+    >>> records = [('A', 'SMITH'), ('B', 'SMYTH'), ('C', 'SMITHE'),
+    ...            ('D', 'SCHMIDT')]
+    >>> idx = symdel.Index(makekey, records)
+    >>> sorted(idx.compare(compare))
+    [(('A', 'SMITH'), ('B', 'SMYTH')), (('A', 'SMITH'), ('C', 'SMITHE'))]
+    >>> other = symdel.Index(makekey, [('E', 'SMYTHE')])
+    >>> sorted(idx.compare(compare, other))
+    [(('B', 'SMYTH'), ('E', 'SMYTHE')), (('C', 'SMITHE'), ('E', 'SMYTHE'))]
+    >>> idx.lookup([('F', 'SMIHT')])
+    [[]]
+    >>> idx.lookup([('F', 'SMIT')])
+    [[('A', 'SMITH')]]
+    >>> short = symdel.Index(makekey, [('G', 'X'), ('H', 'Y'), ('I', 'XZ')])
+    >>> sorted(short.compare(compare))
+    [(('G', 'X'), ('H', 'Y')), (('G', 'X'), ('I', 'XZ'))]
+    """
+
+    # the blocks alone do not decide which pairs are within the distance
+    storedkeys = None
+
+    def __init__(self, makekey, records=None, distance=1, maxblock=None,
+                 subkey=None, maxfreq=None, stoplist=None):
+        if distance < 0:
+            raise ValueError("distance: {0} is negative".format(distance))
+        self.distance = distance
+        super(Index, self).__init__(makekey, records, maxblock, subkey,
+                                    maxfreq, stoplist)
+
+    def _blockkeys(self, keys):
+        """Deletion variants of all the keys."""
+        variants = set()
+        for key in keys:
+            variants.update(deletions(key, self.distance))
+        return sorted(variants)
+
+    def _verifier(self, other=None):
+        """Function testing whether records of this index and of the other
+        index have keys within the edit distance, caching the keys of each
+        record.  The cache holds on to the records, as those decoded by a
+        :class:`MappedIndex` would otherwise free their `id` for reuse."""
+        index = self if other is None else other
+        if index.distance != self.distance:
+            raise ValueError("distance: {0} != {1}".format(
+                self.distance, index.distance))
+        distance, makekey = self.distance, index.makekey
+        keys1, keys2 = {}, {}
+
+        def close(rec1, rec2):
+            """Whether any keys of the records are near enough."""
+            entry1 = keys1.get(id(rec1))
+            if entry1 is None:
+                entry1 = keys1[id(rec1)] = (rec1, self.makekey(rec1))
+            entry2 = keys2.get(id(rec2))
+            if entry2 is None:
+                entry2 = keys2[id(rec2)] = (rec2, makekey(rec2))
+            return any(levenshtein(a, b) <= distance
+                       for a in entry1[1] for b in entry2[1])
+        return close
+
+    def pairs(self, other=None):
+        """Generate the pairs of records with keys within the edit distance.
+        A pair may be generated more than once when the keys share several
+        variants.
+
+        :type other: :class:`Index` or :keyword:`None`
+        :param other: Pair records of this index with records of `other`.
+        :rtype: iter [(`R1`, `R2`), ...]
+        :return: Pairs with `R1` <= `R2` for a single index, otherwise\
+        with `R1` from `self` and `R2` from `other`.
+        """
+        single = other is None or other is self
+        close = self._verifier(None if single else other)
+        for pair in super(Index, self).pairs(other):
+            if close(pair[0], pair[1]):
+                yield pair
+
+    def link(self, record, other=None):
+        """Insert a record and return the pairs it forms with the records
+        already indexed with keys within the edit distance.
+
+        >>> from dedupe import symdel
+        >>> idx = symdel.Index(lambda r: [r[1]], [('A', 'JONES')])
+        >>> idx.link(('B', 'JONS'))
+        [(('A', 'JONES'), ('B', 'JONS'))]
+        >>> idx.link(('C', 'JAMES'))
+        []
+        """
+        single = other is None or other is self
+        close = self._verifier(None if single else other)
+        return [(a, b) for a, b in super(Index, self).link(record, other)
+                if close(a, b)]
+
+    def lookup(self, probes, compare=None, k=None, score=None):
+        """Find the indexed records with a key within the edit distance of a
+        key of each probe record, see :meth:`~block.Index.lookup`."""
+        close = self._verifier(self)
+        found = [[record for record in records if close(record, probe)]
+                 for probe, records in zip(
+                     probes, super(Index, self).lookup(probes))]
+        if compare is None:
+            return found
+        return [rank([(record, compare(probe, record)) for record in records],
+                     k, score) for probe, records in zip(probes, found)]
+
+    @classmethod
+    def load(cls, makekey, path, **options):
+        """Open an index saved with :meth:`~block.Index.save` as a
+        read-only :class:`MappedIndex`.
+
+        >>> import os, tempfile
+        >>> from dedupe import symdel
+        >>> makekey = lambda r: [r[1]]
+        >>> path = os.path.join(tempfile.mkdtemp(), 'idx.bin')
+        >>> symdel.Index(makekey, [('A', 'JONES'), ('B', 'JAMES')]).save(path)
+        >>> mapped = symdel.Index.load(makekey, path)
+        >>> mapped.lookup([('C', 'JONS')])
+        [[('A', 'JONES')]]
+        >>> mapped.close()
+        """
+        return MappedIndex(makekey, path, **options)
+
+
+class MappedIndex(Index, block.MappedIndex):
+    """Read-only :class:`Index` on a memory-mapped file written by
+    :meth:`~block.Index.save`, see :class:`~block.MappedIndex`.  The
+    `distance` must be the same as when the index was saved.
+    """
+
+    def __init__(self, makekey, path, distance=1, maxblock=None,
+                 subkey=None, maxfreq=None, stoplist=None):
+        if distance < 0:
+            raise ValueError("distance: {0} is negative".format(distance))
+        self.distance = distance
+        block.MappedIndex.__init__(self, makekey, path, maxblock, subkey,
+                                   maxfreq, stoplist)
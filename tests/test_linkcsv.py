@@ -1,12 +1,14 @@
 #!/usr/bin/env python
 
 import logging
+import shutil
 import sys
+import tempfile
 import unittest
 from os.path import dirname, join
 sys.path.insert(0, dirname(dirname(dirname(__file__))))
 
-from dedupe import block, sim, linkcsv
+from dedupe import block, progressive, sim, linkcsv
 
 
 def classify(comparisons):
@@ -47,6 +49,24 @@ class FakeOpen:
         pass
 
 
+def numeric(idxtype=block.Index, vcompare=None):
+    """Index strategy and comparator on the number in the second field.
+
+    :type idxtype: `type`
+    :param idxtype: class for constructing the index.
+    :type vcompare: function(float, float) float
+    :param vcompare: compares the numbers, by default on their integer part.
+    """
+    makekey = lambda r: [int(float(r[1]))]
+    if vcompare is None:
+        vcompare = lambda x, y: float(int(x) == int(y))
+    indexing = [("Idx", idxtype, makekey)]
+    comparator = sim.Record(
+        ("Compare", sim.Field(vcompare, 1, float)),
+    )
+    return indexing, comparator
+
+
 class TestLinkCSV(unittest.TestCase):
 
     def test(self):
@@ -70,5 +90,48 @@ class TestLinkCSV(unittest.TestCase):
             "/master", indexing, comparator, classify, records, master=records)
         linker.write_all()
 
+    def test_saved_master(self):
+        linkcsv.open = FakeOpen
+        records = [("A", "5.5"), ("B", "3.5"), ("C", "5.25")]
+        indexing, comparator = numeric(block.CompactIndex)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            sim.Indices(indexing, records).save(tmpdir, "master-")
+            master = sim.Indices.load(indexing, tmpdir, "master-")
+            linker = linkcsv.LinkCSV(
+                None, indexing, comparator, classify, records, master=master)
+            expected = linkcsv.LinkCSV(
+                None, indexing, comparator, classify, records, master=records)
+            self.assertEqual(linker.comparisons, expected.comparisons)
+            self.assertEqual(list(linker.records2), records)
+            master["Idx"].close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_best_master(self):
+        linkcsv.open = FakeOpen
+        records = [("A", "5.5"), ("B", "3.5")]
+        master = [("C", "5.25"), ("D", "5.75"), ("E", "5.0"), ("F", "3.0")]
+        indexing, comparator = numeric(vcompare=lambda x, y: 1.0 - abs(x - y))
+        linker = linkcsv.LinkCSV(
+            None, indexing, comparator, classify, records, master=master,
+            k=2)
+        self.assertEqual(sorted(linker.comparisons), [
+            (("A", "5.5"), ("C", "5.25")), (("A", "5.5"), ("D", "5.75")),
+            (("B", "3.5"), ("F", "3.0"))])
+
+    def test_budget(self):
+        linkcsv.open = FakeOpen
+        records = [("A", "5.5"), ("B", "3.5"), ("C", "5.25"), ("D", "5.0"),
+                   ("E", "3.25")]
+        indexing, comparator = numeric()
+        linker = linkcsv.LinkCSV(
+            None, indexing, comparator, classify, records,
+            budget=progressive.Budget(comparisons=1))
+        # the pair in the smaller block is compared first
+        self.assertEqual(linker.comparisons.keys(),
+                         [(("B", "3.5"), ("E", "3.25"))])
+        self.assertEqual(len(linker.unexplored), 3)
+
 if __name__ == "__main__":
     unittest.main()